@@ -29,12 +29,42 @@ def create_app():
     app.config["OPENAI_CLIENT"] = (
         OpenAI(api_key=app.config["OPENAI_API_KEY"]) if app.config["OPENAI_API_KEY"] else None
     )
+    app.config["LLM_CACHE_MAX"] = int(os.getenv("LLM_CACHE_MAX", "1000"))  # respostas de 1º turno em cache (0 = desliga)
+    app.config["LLM_CACHE_TTL"] = float(os.getenv("LLM_CACHE_TTL", "21600"))  # seg
+    app.config["CONTEXT_TOKEN_BUDGET"] = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1200"))  # histórico + resumo no prompt
+    app.config["CONTEXT_MAX_TURNS"] = int(os.getenv("CONTEXT_MAX_TURNS", "8"))  # mensagens cruas no histórico
+    app.config["SUMMARY_MAX_TOKENS"] = int(os.getenv("SUMMARY_MAX_TOKENS", "200"))
+    app.config["CATALOG_FACTS_K"] = int(os.getenv("CATALOG_FACTS_K", "3"))  # ofertas no prompt da IA (0 desliga)
+    app.config["CATALOG_FACTS_TOKENS"] = int(os.getenv("CATALOG_FACTS_TOKENS", "300"))
+    app.config["GREETING_POOL_SIZE"] = int(os.getenv("GREETING_POOL_SIZE", "8"))  # por (saudação, parte do dia); 0 = IA síncrona
+    app.config["GREETING_POOL_LOW"] = int(os.getenv("GREETING_POOL_LOW", "3"))  # abaixo disso repõe em segundo plano
+    app.config["GREETING_POOL_MAX_USES"] = int(os.getenv("GREETING_POOL_MAX_USES", "5"))
+    # disjuntor da OpenAI: abre com >= BREAKER_ERROR_RATE de erro nas últimas BREAKER_WINDOW chamadas
+    app.config["BREAKER_WINDOW"] = int(os.getenv("BREAKER_WINDOW", "20"))
+    app.config["BREAKER_MIN_CALLS"] = int(os.getenv("BREAKER_MIN_CALLS", "5"))
+    app.config["BREAKER_ERROR_RATE"] = float(os.getenv("BREAKER_ERROR_RATE", "0.5"))
+    app.config["BREAKER_OPEN_SECONDS"] = float(os.getenv("BREAKER_OPEN_SECONDS", "30"))
+    app.config["BREAKER_TIMEOUT_MIN"] = float(os.getenv("BREAKER_TIMEOUT_MIN", "1.5"))  # seg
+    app.config["BREAKER_TIMEOUT_FACTOR"] = float(os.getenv("BREAKER_TIMEOUT_FACTOR", "2"))  # x p95
 
     # Twilio (opcional)
     app.config["TWILIO_ACCOUNT_SID"] = os.getenv("TWILIO_ACCOUNT_SID")
     app.config["TWILIO_AUTH_TOKEN"] = os.getenv("TWILIO_AUTH_TOKEN")
     app.config["TWILIO_WHATSAPP_FROM"] = os.getenv("TWILIO_WHATSAPP_FROM")  # ex.: whatsapp:+1415...
     app.config["FORCE_TWILIO_API_REPLY"] = os.getenv("FORCE_TWILIO_API_REPLY", "0") in ("1", "true", "True")
+    # webhook só aceita POST assinado pelo Twilio (X-Twilio-Signature) quando há TWILIO_AUTH_TOKEN
+    app.config["TWILIO_VALIDATE_SIGNATURE"] = os.getenv("TWILIO_VALIDATE_SIGNATURE", "1") in ("1", "true", "True")
+    # URL pública configurada no Twilio (atrás de proxy); vazio = URL da requisição + X-Forwarded-Proto/Host
+    app.config["TWILIO_WEBHOOK_URL"] = os.getenv("TWILIO_WEBHOOK_URL", "")
+    # Resposta assíncrona: webhook só enfileira (200 vazio) e um pool responde via API
+    app.config["ASYNC_REPLY"] = os.getenv("ASYNC_REPLY", "0") in ("1", "true", "True")
+    app.config["REPLY_WORKERS"] = int(os.getenv("REPLY_WORKERS", "4"))
+    app.config["REPLY_QUEUE_MAX"] = int(os.getenv("REPLY_QUEUE_MAX", "1000"))  # por worker; cheia = responde síncrono
+    app.config["TWILIO_MAX_RETRIES"] = int(os.getenv("TWILIO_MAX_RETRIES", "3"))  # 429/ConnectTimeout (5xx só 1x), com backoff
+    app.config["TWILIO_TIMEOUT"] = float(os.getenv("TWILIO_TIMEOUT", "10"))  # seg por tentativa
+    # mensagens do mesmo número com menos de REPLY_DEBOUNCE seg entre si viram um turno (0 desliga)
+    app.config["REPLY_DEBOUNCE"] = float(os.getenv("REPLY_DEBOUNCE", "1.5"))
+    app.config["REPLY_DEBOUNCE_MAX"] = float(os.getenv("REPLY_DEBOUNCE_MAX", "6"))  # espera máx. desde a 1ª
 
     # Google Calendar
     app.config["GCAL_CALENDAR_ID"] = os.getenv("GCAL_CALENDAR_ID", "")
@@ -43,19 +73,33 @@ def create_app():
     # ---------- FILES / DATA ----------
     BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
-    DATA_DIR = os.path.join(BASE_DIR, "data")
+    DATA_DIR = os.getenv("DATA_DIR") or os.path.join(BASE_DIR, "data")
     os.makedirs(DATA_DIR, exist_ok=True)
     app.config["DATA_DIR"] = DATA_DIR
-    app.config["SESSIONS_FILE"] = os.path.join(DATA_DIR, "sessions.json")
+    app.config["SESSIONS_FILE"] = os.path.join(DATA_DIR, "sessions.json")  # formato antigo (migrado no boot)
+    app.config["SESSIONS_DB"] = os.path.join(DATA_DIR, "sessions.db")
+    app.config["SESSION_CACHE_MAX"] = int(os.getenv("SESSION_CACHE_MAX", "2000"))  # conversas em memória por worker
+    app.config["SESSION_CACHE_TTL"] = float(os.getenv("SESSION_CACHE_TTL", "1800"))  # seg ociosa até sair da memória
+    app.config["WEB_CONCURRENCY"] = int(os.getenv("WEB_CONCURRENCY", "1"))  # workers do gunicorn (estado fica no SQLite)
     app.config["LEADS_FILE"] = os.path.join(DATA_DIR, "leads.csv")
+    app.config["LEADS_DB"] = os.path.join(DATA_DIR, "leads.db")  # cópia indexada do leads.csv
+    app.config["LEADS_ARCHIVE_DIR"] = os.path.join(DATA_DIR, "leads_segments")  # segmentos .csv.gz + manifest
+    app.config["LEADS_SEGMENT_MAX_BYTES"] = int(float(os.getenv("LEADS_SEGMENT_MAX_MB", "8")) * 2**20)
+    app.config["LEADS_SEGMENT_MAX_AGE"] = float(os.getenv("LEADS_SEGMENT_MAX_HOURS", "24")) * 3600
     app.config["APPT_FILE"] = os.path.join(DATA_DIR, "agendamentos.csv")
+    app.config["LOG_QUEUE_MAX"] = int(os.getenv("LOG_QUEUE_MAX", "10000"))  # linhas na fila antes de gravar no request
+    app.config["LOG_FLUSH_ROWS"] = int(os.getenv("LOG_FLUSH_ROWS", "200"))  # grava quando junta N linhas...
+    app.config["LOG_FLUSH_INTERVAL"] = float(os.getenv("LOG_FLUSH_INTERVAL", "1"))  # ...ou após N segundos
     app.config["OFFERS_PATH"] = os.path.join(DATA_DIR, "ofertas.json")
+    app.config["CATALOG_RELOAD_INTERVAL"] = float(os.getenv("CATALOG_RELOAD_INTERVAL", "2"))  # seg entre stats do ofertas.json
+    app.config["CATALOG_MIN_SCORE"] = float(os.getenv("CATALOG_MIN_SCORE", "1.2"))  # confiança mínima da busca ranqueada
 
     # --- KB (prompts)
     KB_DIR = os.path.join(BASE_DIR, "kb")
     os.makedirs(KB_DIR, exist_ok=True)
     app.config["KB_SYSTEM_PROMPT_PATH"] = os.path.join(KB_DIR, "system_prompt.txt")
     app.config["KB_FEWSHOTS_PATH"] = os.path.join(KB_DIR, "fewshots.json")
+    app.config["KB_RELOAD_INTERVAL"] = float(os.getenv("KB_RELOAD_INTERVAL", "2"))  # seg entre checagens de mtime
 
     # --- Identidade de quem atende
     app.config["CONSULTANT_NAME"] = os.getenv("CONSULTANT_NAME", "Felipe Fortes")
@@ -111,12 +155,42 @@ def create_app():
     app.config["OPENAI_CLIENT"] = (
         OpenAI(api_key=app.config["OPENAI_API_KEY"]) if app.config["OPENAI_API_KEY"] else None
     )
+    app.config["LLM_CACHE_MAX"] = int(os.getenv("LLM_CACHE_MAX", "1000"))  # respostas de 1º turno em cache (0 = desliga)
+    app.config["LLM_CACHE_TTL"] = float(os.getenv("LLM_CACHE_TTL", "21600"))  # seg
+    app.config["CONTEXT_TOKEN_BUDGET"] = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1200"))  # histórico + resumo no prompt
+    app.config["CONTEXT_MAX_TURNS"] = int(os.getenv("CONTEXT_MAX_TURNS", "8"))  # mensagens cruas no histórico
+    app.config["SUMMARY_MAX_TOKENS"] = int(os.getenv("SUMMARY_MAX_TOKENS", "200"))
+    app.config["CATALOG_FACTS_K"] = int(os.getenv("CATALOG_FACTS_K", "3"))  # ofertas no prompt da IA (0 desliga)
+    app.config["CATALOG_FACTS_TOKENS"] = int(os.getenv("CATALOG_FACTS_TOKENS", "300"))
+    app.config["GREETING_POOL_SIZE"] = int(os.getenv("GREETING_POOL_SIZE", "8"))  # por (saudação, parte do dia); 0 = IA síncrona
+    app.config["GREETING_POOL_LOW"] = int(os.getenv("GREETING_POOL_LOW", "3"))  # abaixo disso repõe em segundo plano
+    app.config["GREETING_POOL_MAX_USES"] = int(os.getenv("GREETING_POOL_MAX_USES", "5"))
+    # disjuntor da OpenAI: abre com >= BREAKER_ERROR_RATE de erro nas últimas BREAKER_WINDOW chamadas
+    app.config["BREAKER_WINDOW"] = int(os.getenv("BREAKER_WINDOW", "20"))
+    app.config["BREAKER_MIN_CALLS"] = int(os.getenv("BREAKER_MIN_CALLS", "5"))
+    app.config["BREAKER_ERROR_RATE"] = float(os.getenv("BREAKER_ERROR_RATE", "0.5"))
+    app.config["BREAKER_OPEN_SECONDS"] = float(os.getenv("BREAKER_OPEN_SECONDS", "30"))
+    app.config["BREAKER_TIMEOUT_MIN"] = float(os.getenv("BREAKER_TIMEOUT_MIN", "1.5"))  # seg
+    app.config["BREAKER_TIMEOUT_FACTOR"] = float(os.getenv("BREAKER_TIMEOUT_FACTOR", "2"))  # x p95
 
     # Twilio (opcional)
     app.config["TWILIO_ACCOUNT_SID"] = os.getenv("TWILIO_ACCOUNT_SID")
     app.config["TWILIO_AUTH_TOKEN"] = os.getenv("TWILIO_AUTH_TOKEN")
     app.config["TWILIO_WHATSAPP_FROM"] = os.getenv("TWILIO_WHATSAPP_FROM")  # ex.: whatsapp:+1415...
     app.config["FORCE_TWILIO_API_REPLY"] = os.getenv("FORCE_TWILIO_API_REPLY", "0") in ("1", "true", "True")
+    # webhook só aceita POST assinado pelo Twilio (X-Twilio-Signature) quando há TWILIO_AUTH_TOKEN
+    app.config["TWILIO_VALIDATE_SIGNATURE"] = os.getenv("TWILIO_VALIDATE_SIGNATURE", "1") in ("1", "true", "True")
+    # URL pública configurada no Twilio (atrás de proxy); vazio = URL da requisição + X-Forwarded-Proto/Host
+    app.config["TWILIO_WEBHOOK_URL"] = os.getenv("TWILIO_WEBHOOK_URL", "")
+    # Resposta assíncrona: webhook só enfileira (200 vazio) e um pool responde via API
+    app.config["ASYNC_REPLY"] = os.getenv("ASYNC_REPLY", "0") in ("1", "true", "True")
+    app.config["REPLY_WORKERS"] = int(os.getenv("REPLY_WORKERS", "4"))
+    app.config["REPLY_QUEUE_MAX"] = int(os.getenv("REPLY_QUEUE_MAX", "1000"))  # por worker; cheia = responde síncrono
+    app.config["TWILIO_MAX_RETRIES"] = int(os.getenv("TWILIO_MAX_RETRIES", "3"))  # 429/ConnectTimeout (5xx só 1x), com backoff
+    app.config["TWILIO_TIMEOUT"] = float(os.getenv("TWILIO_TIMEOUT", "10"))  # seg por tentativa
+    # mensagens do mesmo número com menos de REPLY_DEBOUNCE seg entre si viram um turno (0 desliga)
+    app.config["REPLY_DEBOUNCE"] = float(os.getenv("REPLY_DEBOUNCE", "1.5"))
+    app.config["REPLY_DEBOUNCE_MAX"] = float(os.getenv("REPLY_DEBOUNCE_MAX", "6"))  # espera máx. desde a 1ª
 
     # Google Calendar
     app.config["GCAL_CALENDAR_ID"] = os.getenv("GCAL_CALENDAR_ID", "")
@@ -125,19 +199,33 @@ def create_app():
     # ---------- FILES / DATA ----------
     BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
-    DATA_DIR = os.path.join(BASE_DIR, "data")
+    DATA_DIR = os.getenv("DATA_DIR") or os.path.join(BASE_DIR, "data")
     os.makedirs(DATA_DIR, exist_ok=True)
     app.config["DATA_DIR"] = DATA_DIR
-    app.config["SESSIONS_FILE"] = os.path.join(DATA_DIR, "sessions.json")
+    app.config["SESSIONS_FILE"] = os.path.join(DATA_DIR, "sessions.json")  # formato antigo (migrado no boot)
+    app.config["SESSIONS_DB"] = os.path.join(DATA_DIR, "sessions.db")
+    app.config["SESSION_CACHE_MAX"] = int(os.getenv("SESSION_CACHE_MAX", "2000"))  # conversas em memória por worker
+    app.config["SESSION_CACHE_TTL"] = float(os.getenv("SESSION_CACHE_TTL", "1800"))  # seg ociosa até sair da memória
+    app.config["WEB_CONCURRENCY"] = int(os.getenv("WEB_CONCURRENCY", "1"))  # workers do gunicorn (estado fica no SQLite)
     app.config["LEADS_FILE"] = os.path.join(DATA_DIR, "leads.csv")
+    app.config["LEADS_DB"] = os.path.join(DATA_DIR, "leads.db")  # cópia indexada do leads.csv
+    app.config["LEADS_ARCHIVE_DIR"] = os.path.join(DATA_DIR, "leads_segments")  # segmentos .csv.gz + manifest
+    app.config["LEADS_SEGMENT_MAX_BYTES"] = int(float(os.getenv("LEADS_SEGMENT_MAX_MB", "8")) * 2**20)
+    app.config["LEADS_SEGMENT_MAX_AGE"] = float(os.getenv("LEADS_SEGMENT_MAX_HOURS", "24")) * 3600
     app.config["APPT_FILE"] = os.path.join(DATA_DIR, "agendamentos.csv")
+    app.config["LOG_QUEUE_MAX"] = int(os.getenv("LOG_QUEUE_MAX", "10000"))  # linhas na fila antes de gravar no request
+    app.config["LOG_FLUSH_ROWS"] = int(os.getenv("LOG_FLUSH_ROWS", "200"))  # grava quando junta N linhas...
+    app.config["LOG_FLUSH_INTERVAL"] = float(os.getenv("LOG_FLUSH_INTERVAL", "1"))  # ...ou após N segundos
     app.config["OFFERS_PATH"] = os.path.join(DATA_DIR, "ofertas.json")
+    app.config["CATALOG_RELOAD_INTERVAL"] = float(os.getenv("CATALOG_RELOAD_INTERVAL", "2"))  # seg entre stats do ofertas.json
+    app.config["CATALOG_MIN_SCORE"] = float(os.getenv("CATALOG_MIN_SCORE", "1.2"))  # confiança mínima da busca ranqueada
 
     # --- KB (prompts)
     KB_DIR = os.path.join(BASE_DIR, "kb")
     os.makedirs(KB_DIR, exist_ok=True)
     app.config["KB_SYSTEM_PROMPT_PATH"] = os.path.join(KB_DIR, "system_prompt.txt")
     app.config["KB_FEWSHOTS_PATH"] = os.path.join(KB_DIR, "fewshots.json")
+    app.config["KB_RELOAD_INTERVAL"] = float(os.getenv("KB_RELOAD_INTERVAL", "2"))  # seg entre checagens de mtime
 
     # --- Identidade de quem atende
     app.config["CONSULTANT_NAME"] = os.getenv("CONSULTANT_NAME", "Felipe Fortes")
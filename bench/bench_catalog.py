@@ -0,0 +1,162 @@
+# bench/bench_catalog.py
+"""
+Benchmark do catálogo com catálogos sintéticos (mesmo schema do ofertas.json).
+
+  python bench/bench_catalog.py                       # 100, 1k, 10k, 100k
+  python bench/bench_catalog.py --sizes 100,1000 --queries 500 --out bench/results/local.json
+
+Para cada tamanho mede:
+- load: parse do JSON (load_offers) e montagem do snapshot (índices + textos prontos);
+- latência por consulta (p50/p95/p99, em us) de buscar_oferta (linear),
+  snapshot.index.buscar, ranker.top e tentar_responder_com_catalogo;
+- memória: pico do tracemalloc durante o load e tamanho do arquivo.
+O resultado vai em JSON (com o commit atual) para comparar entre commits.
+"""
+import os, sys, json, time, random, argparse, platform, subprocess, tempfile, tracemalloc
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+import catalog  # noqa: E402
+
+MODELOS = {
+    "Fiat Mobi": ["Like", "Trekking"], "Fiat Argo": ["Drive", "Trekking", "Precision"],
+    "Fiat Cronos": ["Drive", "Precision"], "Fiat Pulse": ["Drive", "Audace", "Impetus", "Abarth"],
+    "Fiat Fastback": ["Audace", "Impetus", "Limited", "Abarth"], "Fiat Strada": ["Endurance", "Freedom", "Volcano", "Ranch", "Ultra"],
+    "Fiat Toro": ["Endurance", "Freedom", "Volcano", "Ranch", "Ultra"], "Fiat Titano": ["Endurance", "Volcano", "Ranch"],
+    "Fiat Fiorino": ["Endurance"], "Fiat Ducato": ["Cargo", "Minibus", "Maxicargo"],
+}
+MOTORES = ["1.0 Fire", "1.3 Firefly", "1.0 Turbo 200", "1.3 Turbo 270", "2.0 Turbo Diesel", "2.2 Turbo Diesel", "2.3 Diesel", "1.4 Fire"]
+CAMBIOS = ["Manual", "Automático CVT", "Automático AT6", "Automático 9 marchas"]
+COMBUSTIVEIS = ["Flex", "Flex", "Flex", "Diesel"]
+TAGS = ["hatch", "sedan", "SUV", "SUV-cupê", "picape", "utilitário", "van", "econômico", "turbo", "4x4", "esportivo", "família", "top", "cargo"]
+PUBLICO = ["Família", "Urbano", "Conforto", "Jovem", "Aventura", "Produtor Rural", "Primeiro carro", "Trabalho", "Frotista", "Aplicativo", "Executivo", "Viagem"]
+CONDICOES = [
+    "Taxa a partir de 0,99% ao mês", "Taxa 0% em 12x", "Bônus de até R$ 10.000 no usado na troca", "IPVA 2025 grátis",
+    "Documentação cortesia", "Primeira revisão grátis", "Entrada facilitada", "Pacote de acessórios com 20% OFF",
+]
+CORES = ["branco", "preto", "prata", "cinza", "vermelho", "azul"]
+
+CONSULTAS = [
+    "quanto custa o {m}?", "preço do {m} {v}", "link do {m}", "tem {m} {v} automático?", "qual a taxa do {m}",
+    "quero ver ofertas", "ficha do {m} {v}", "para quem é o {m}?", "{m} {v} {c}", "oi, queria saber do {m}",
+    "diesel até 200 mil", "automático para família", "picape mais barata", "vocês abrem sábado?",
+    "aceita usado na troca?", "fastbak", "stradda freedom", "qual o valor do {m} {v} 2026 na cor {cor}?",
+]
+
+def gerar_catalogo(n: int, seed: int = 42):
+    rnd = random.Random(seed)
+    modelos = list(MODELOS)
+    out = []
+    for i in range(n):
+        modelo = rnd.choice(modelos)
+        versao = rnd.choice(MODELOS[modelo])
+        motor, cambio = rnd.choice(MOTORES), rnd.choice(CAMBIOS)
+        slug = modelo.split()[-1].lower()
+        preco = rnd.randrange(60_000, 400_000, 10)
+        o = {
+            "modelo": modelo,
+            "versao": f"{versao} {motor.split()[0]} {cambio.split()[-1]} {rnd.choice([2025, 2026])}",
+            "motor": motor, "cambio": cambio, "combustivel": rnd.choice(COMBUSTIVEIS),
+            "condicoes": rnd.sample(CONDICOES, rnd.randint(1, 3)),
+            "publico_alvo": rnd.sample(PUBLICO, rnd.randint(1, 4)),
+            "tags": [slug, versao.lower()] + rnd.sample(TAGS, rnd.randint(1, 4)),
+            "link_modelo": f"https://www.globofiat.com.br/globo-fiat-itajai/novos/fiat-{slug}",
+            "link_oferta": f"https://www.globofiat.com.br/globo-fiat-itajai/novos/fiat-{slug}?versao={versao.lower()}-{i}",
+        }
+        o["preco_por" if rnd.random() < 0.7 else "preco_a_partir"] = preco
+        out.append(o)
+    return out
+
+def gerar_consultas(n: int, seed: int = 7):
+    rnd = random.Random(seed)
+    out = []
+    for _ in range(n):
+        m = rnd.choice(list(MODELOS))
+        out.append(rnd.choice(CONSULTAS).format(
+            m=m.split()[-1].lower() if rnd.random() < 0.7 else m, v=rnd.choice(MODELOS[m]).lower(),
+            c=rnd.choice(CAMBIOS).lower(), cor=rnd.choice(CORES)))
+    return out
+
+def percentis(amostras_s):
+    xs = sorted(amostras_s)
+    def p(q): return round(xs[min(len(xs) - 1, int(q * len(xs)))] * 1e6, 2)
+    return {"p50_us": p(0.50), "p95_us": p(0.95), "p99_us": p(0.99), "max_us": round(xs[-1] * 1e6, 2), "n": len(xs)}
+
+def medir(fn, consultas):
+    tempos = []
+    for q in consultas:
+        t0 = time.perf_counter()
+        fn(q)
+        tempos.append(time.perf_counter() - t0)
+    return percentis(tempos)
+
+def rodar(n: int, n_consultas: int, tmpdir: str, linear_max: int):
+    path = os.path.join(tmpdir, f"ofertas_{n}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(gerar_catalogo(n), f, ensure_ascii=False)
+    consultas = gerar_consultas(n_consultas)
+
+    t0 = time.perf_counter()
+    ofertas = catalog.load_offers(path)
+    t_parse = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    snap = catalog.get_catalog(path, check_interval=3600).snapshot()
+    t_total = time.perf_counter() - t0
+
+    # memória numa segunda montagem (o tracemalloc distorce os tempos acima)
+    tracemalloc.start()
+    catalog.CatalogSnapshot(catalog.load_offers(path), 0)
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    res = {
+        "offers": n,
+        "file_bytes": os.path.getsize(path),
+        "load": {"parse_ms": round(t_parse * 1000, 2), "parse_and_snapshot_ms": round(t_total * 1000, 2)},
+        "peak_mem_mb": round(pico / 2**20, 2),
+        "query": {
+            "index.buscar": medir(snap.index.buscar, consultas),
+            "ranker.top": medir(lambda q: snap.ranker.top(q, 3), consultas),
+            "tentar_responder_com_catalogo": medir(lambda q: catalog.tentar_responder_com_catalogo(q, path), consultas),
+        },
+    }
+    if n <= linear_max:  # a varredura linear fica lenta demais nos tamanhos grandes
+        res["query"]["buscar_oferta (linear)"] = medir(lambda q: catalog.buscar_oferta(q, ofertas), consultas)
+    return res
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True).strip()
+    except Exception:
+        return None
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", default="100,1000,10000,100000")
+    ap.add_argument("--queries", type=int, default=2000)
+    ap.add_argument("--linear-max", type=int, default=10000, help="maior catálogo em que roda a busca linear")
+    ap.add_argument("--out", default=None, help="JSON de saída (padrão: bench/results/catalog-<commit>.json)")
+    args = ap.parse_args()
+
+    commit = git_commit()
+    out = args.out or os.path.join(ROOT, "bench", "results", f"catalog-{commit or 'local'}.json")
+    resultado = {
+        "commit": commit, "python": platform.python_version(), "machine": platform.machine(),
+        "when": time.strftime("%Y-%m-%dT%H:%M:%S"), "queries": args.queries, "runs": [],
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in (int(x) for x in args.sizes.split(",")):
+            r = rodar(n, args.queries, tmp, args.linear_max)
+            resultado["runs"].append(r)
+            q = r["query"]
+            print(f"{n:>7} ofertas | load {r['load']['parse_and_snapshot_ms']:>9.1f} ms | mem {r['peak_mem_mb']:>7.1f} MB | "
+                  f"responder p50 {q['tentar_responder_com_catalogo']['p50_us']:>8.1f} us "
+                  f"p99 {q['tentar_responder_com_catalogo']['p99_us']:>8.1f} us")
+
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(resultado, f, ensure_ascii=False, indent=2)
+    print(f"resultado: {out}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+# bench/bench_intents.py
+"""
+Micro-benchmark da classificação de intenção por mensagem.
+
+  python bench/bench_intents.py [--n 20000]
+
+"antes" = as varreduras separadas que o webhook fazia (cópia congelada abaixo);
+"depois" = intents.classify (uma regex compilada, uma varredura).
+Também confere que as flags batem nas mensagens de exemplo.
+"""
+import os, re, sys, time, argparse, statistics
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from intents import classify  # noqa: E402
+
+MENSAGENS = [
+    "oi", "Bom dia!", "boa tarde, tudo bem?", "e aí", "Olá", "salve",
+    "quero ver ofertas", "tem promoção do pulse?", "preço do toro ranch",
+    "qual a taxa de financiamento do argo?", "link do fastback", "para quem é o mobi?",
+    "quero agendar um test drive sábado", "dá pra marcar uma visita amanhã?",
+    "vocês abrem sábado?", "onde fica a loja?", "aceita usado na troca?",
+    "boa noite, queria saber o valor da strada volcano automática e se tem cores disponíveis",
+    "Oi, tudo bem? Estou procurando um carro para a família, algo econômico e com câmbio automático, "
+    "de preferência até 120 mil. Vocês têm alguma opção assim em estoque?",
+    "ficha técnica do cronos", "resumo do ducato", "SAIR", "ok", "obrigado!",
+]
+
+# ---------- antes (cópia congelada do código anterior) ----------
+def _vehicle_intent(s):
+    s = (s or "").lower()
+    kws = ["oferta", "ofertas", "promo", "promoção", "promocao", "preço", "preco", "a partir", "por", "link",
+           "agendar", "agenda", "test", "test drive", "modelo", "dispon", "estoque", "cores",
+           "pulse", "toro", "strada", "mobi", "argo", "fastback", "cronos", "fiorino", "ducato"]
+    return any(k in s for k in kws)
+
+def wants_appointment(msg):
+    s = (msg or "").lower()
+    return any(g in s for g in ["agendar", "agenda", "marcar", "test drive", "testdrive", "visita", "conhecer o carro"])
+
+def is_greeting(texto):
+    s = (texto or "").strip().lower()
+    if _vehicle_intent(s): return False
+    if len(s) > 25: return False
+    gatilhos = ["oi", "olá", "ola", "bom dia", "boa tarde", "boa noite", "salve", "eai", "e aí", "boa"]
+    return any(s == k or s.startswith(k) for k in gatilhos)
+
+def mirror_salute(user_text):
+    s = (user_text or "").strip().lower()
+    if "boa noite" in s: return "Boa noite"
+    if "boa tarde" in s: return "Boa tarde"
+    if "bom dia" in s: return "Bom dia"
+    if re.fullmatch(r"(oi|ol[aá]|salve|e[ai]?)\b.*", s): return "*"
+    return None
+
+def detectar_intencao(msg):
+    s = (msg or "").lower()
+    if any(k in s for k in ["link", "site", "url"]): return "link"
+    if any(k in s for k in ["preço", "preco", "valor", "quanto custa"]): return "preco"
+    if any(k in s for k in ["condição", "condicoes", "condição", "parcel", "financi", "taxa"]): return "condicoes"
+    if any(k in s for k in ["público", "publico", "perfil", "para quem"]): return "publico"
+    if any(k in s for k in ["ficha", "detalhe", "detalhes", "resumo", "informação"]): return "detalhes"
+    if any(k in s for k in ["oferta", "ofertas", "promo", "promoção", "promocao", "lista", "listar"]): return "lista"
+    return "detalhes"
+
+def antes(msg):
+    return (wants_appointment(msg), _vehicle_intent(msg), is_greeting(msg), mirror_salute(msg), detectar_intencao(msg))
+
+def depois(msg):
+    it = classify(msg)
+    salute = it.salute or ("*" if it.salute_generic else None)
+    return (it.appointment, it.vehicle, it.greeting, salute, it.catalog)
+
+# ---------- medição ----------
+def medir(fn, n):
+    amostras = []
+    for _ in range(5):
+        t0 = time.perf_counter()
+        for i in range(n):
+            fn(MENSAGENS[i % len(MENSAGENS)])
+        amostras.append((time.perf_counter() - t0) / n * 1e6)
+    return statistics.median(amostras)
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--n", type=int, default=20000)
+    args = ap.parse_args()
+
+    for m in MENSAGENS:
+        assert antes(m) == depois(m), (m, antes(m), depois(m))
+
+    a = medir(antes, args.n)
+    d = medir(depois, args.n)
+    print(f"antes : {a:7.2f} us/mensagem")
+    print(f"depois: {d:7.2f} us/mensagem  ({a / d:.1f}x)")
+
+if __name__ == "__main__":
+    main()
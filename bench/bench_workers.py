@@ -0,0 +1,129 @@
+# bench/bench_workers.py
+"""
+Throughput do webhook com 1, 2, 4 e 8 workers do gunicorn (estado compartilhado no SQLite).
+
+  python bench/bench_workers.py                          # 1,2,4,8 workers, 10 s cada
+  python bench/bench_workers.py --workers 1,4 --seconds 5 --clients 32
+
+Sobe o gunicorn (wsgi:app) numa porta livre com DATA_DIR temporário e sem OPENAI_API_KEY
+(a resposta do LLM cai no fallback, então mede só o nosso código: estado, catálogo, CSV).
+Os clientes mandam POST /whatsapp com telefones e mensagens variados durante `--seconds`.
+Resultado em JSON (com o commit atual) em bench/results/workers-<commit>.json ou --out.
+"""
+import os, sys, json, time, shutil, random, socket, argparse, platform, tempfile, threading, subprocess
+import urllib.request, urllib.parse
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+MENSAGENS = [
+    "oi", "bom dia", "preço do pulse", "link do fastback", "quero ver ofertas", "diesel até 200 mil",
+    "vocês abrem sábado?", "aceita usado na troca?", "qual a taxa do argo", "xyz", "tem toro automática?",
+]
+
+def porta_livre() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def esperar(url: str, timeout: float = 30):
+    fim = time.time() + timeout
+    while time.time() < fim:
+        try:
+            urllib.request.urlopen(url, timeout=1).read(); return
+        except Exception:
+            time.sleep(0.2)
+    raise RuntimeError(f"servidor não subiu: {url}")
+
+def percentis(xs):
+    xs = sorted(xs)
+    def p(q): return round(xs[min(len(xs) - 1, int(q * len(xs)))] * 1000, 2)
+    return {"p50_ms": p(0.50), "p95_ms": p(0.95), "p99_ms": p(0.99)}
+
+def carga(url: str, clientes: int, segundos: float, telefones: int):
+    tempos, erros = [], [0]
+    lock = threading.Lock()
+    fim = time.time() + segundos
+
+    def cliente(seed):
+        rnd = random.Random(seed)
+        meus, falhas = [], 0
+        while time.time() < fim:
+            dados = urllib.parse.urlencode({
+                "From": f"whatsapp:+55479{rnd.randrange(telefones):07d}", "Body": rnd.choice(MENSAGENS),
+            }).encode()
+            t0 = time.perf_counter()
+            try:
+                urllib.request.urlopen(url, dados, timeout=30).read()
+                meus.append(time.perf_counter() - t0)
+            except Exception:
+                falhas += 1
+        with lock:
+            tempos.extend(meus); erros[0] += falhas
+
+    ths = [threading.Thread(target=cliente, args=(i,)) for i in range(clientes)]
+    t0 = time.time()
+    for t in ths: t.start()
+    for t in ths: t.join()
+    dur = time.time() - t0
+    return {"requests": len(tempos), "errors": erros[0], "rps": round(len(tempos) / dur, 1), **percentis(tempos or [0])}
+
+def rodar(workers: int, args):
+    tmp = tempfile.mkdtemp(prefix="bench-workers-")
+    shutil.copy(os.path.join(ROOT, "data", "ofertas.json"), tmp)
+    porta = porta_livre()
+    env = dict(os.environ, DATA_DIR=tmp, WEB_CONCURRENCY=str(workers), OPENAI_API_KEY="", LOG_LEVEL="WARNING",
+               FORCE_TWILIO_API_REPLY="0", TWILIO_ACCOUNT_SID="", TWILIO_AUTH_TOKEN="")
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "wsgi:app", "-b", f"127.0.0.1:{porta}",
+         "--workers", str(workers), "--threads", str(args.threads), "--log-level", "warning"],
+        cwd=ROOT, env=env,
+    )
+    try:
+        esperar(f"http://127.0.0.1:{porta}/healthz")
+        url = f"http://127.0.0.1:{porta}/whatsapp"
+        carga(url, args.clients, 1.0, args.phones)  # aquecimento (import/catálogo em todos os workers)
+        return {"workers": workers, "threads": args.threads, "clients": args.clients,
+                **carga(url, args.clients, args.seconds, args.phones)}
+    finally:
+        proc.terminate(); proc.wait(10)
+        shutil.rmtree(tmp, ignore_errors=True)
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except Exception:
+        return None
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--workers", default="1,2,4,8")
+    ap.add_argument("--threads", type=int, default=4)
+    ap.add_argument("--clients", type=int, default=16)
+    ap.add_argument("--phones", type=int, default=500, help="telefones distintos simulados")
+    ap.add_argument("--seconds", type=float, default=10)
+    ap.add_argument("--out", default=None, help="JSON de saída (padrão: bench/results/workers-<commit>.json)")
+    args = ap.parse_args()
+
+    commit = git_commit()
+    out = args.out or os.path.join(ROOT, "bench", "results", f"workers-{commit or 'local'}.json")
+    resultado = {
+        "commit": commit, "python": platform.python_version(), "machine": platform.machine(),
+        "cpus": os.cpu_count(), "when": time.strftime("%Y-%m-%dT%H:%M:%S"), "runs": [],
+    }
+    base = None
+    for n in (int(x) for x in args.workers.split(",")):
+        r = rodar(n, args)
+        base = base or r["rps"]
+        r["speedup"] = round(r["rps"] / base, 2) if base else None
+        resultado["runs"].append(r)
+        print(f"{n:>2} workers | {r['rps']:>8.1f} req/s ({r['speedup']}x) | p50 {r['p50_ms']:>7.1f} ms "
+              f"p99 {r['p99_ms']:>7.1f} ms | erros {r['errors']}")
+
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(resultado, f, ensure_ascii=False, indent=2)
+    print(f"resultado: {out}")
+
+if __name__ == "__main__":
+    main()
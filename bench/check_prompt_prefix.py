@@ -0,0 +1,84 @@
+# bench/check_prompt_prefix.py
+"""
+Confere que o prefixo do prompt (system da KB + few-shots) sai byte a byte igual em toda chamada.
+
+  python bench/check_prompt_prefix.py [--conversas 20 --turnos 4]
+
+- roda várias conversas por gerar_resposta com um cliente OpenAI de captura (nada vai para a rede)
+  e compara os bytes das primeiras mensagens de cada chamada com o prefixo da KB;
+- com cópias temporárias de kb/: arquivo igual = mesmo objeto; arquivo mudado = versão nova
+  (e de novo estável); few-shots quebrados = segue com o último prefixo bom.
+Sai com código 1 se algo divergir.
+"""
+import os, sys, json, time, shutil, argparse, tempfile
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+os.environ.setdefault("DATA_DIR", tempfile.mkdtemp(prefix="prefix-check-"))
+os.environ.pop("OPENAI_API_KEY", None)
+from app import create_app  # noqa: E402
+import routes  # noqa: E402
+from prompt_kb import PromptKB, serialize  # noqa: E402
+
+
+class _Captura:
+    """Cliente no formato do openai (chat.completions.create) que só guarda as mensagens."""
+    def __init__(self):
+        self.chamadas = []
+        self.chat = self
+        self.completions = self
+
+    def create(self, **kw):
+        self.chamadas.append(kw["messages"])
+        msg = type("M", (), {"content": f"Resposta {len(self.chamadas)}: posso te mandar as ofertas?"})()
+        return type("R", (), {"choices": [type("C", (), {"message": msg})()]})()
+
+def checar_requests(conversas: int, turnos: int) -> list:
+    app = create_app()
+    cliente = app.config["OPENAI_CLIENT"] = _Captura()
+    erros = []
+    with app.app_context():
+        prefix = routes.prompt_prefix()
+        esperado = serialize(prefix.messages)
+        for t in range(turnos):
+            for c in range(conversas):
+                routes.gerar_resposta(f"+5547999{c:06d}", f"pergunta {t} da conversa {c} sobre financiamento")
+        for i, msgs in enumerate(cliente.chamadas):
+            if serialize(msgs[:len(prefix.messages)]) != esperado:
+                erros.append(f"chamada {i}: prefixo diferente")
+    print(f"requests: {len(cliente.chamadas)} chamadas, prefixo {len(esperado)} bytes "
+          f"({len(prefix.messages) - 1} few-shots), digest {prefix.digest}")
+    return erros
+
+def checar_reload() -> list:
+    erros = []
+    tmp = tempfile.mkdtemp(prefix="kb-")
+    p, f = os.path.join(tmp, "system_prompt.txt"), os.path.join(tmp, "fewshots.json")
+    shutil.copy(os.path.join(ROOT, "kb", "system_prompt.txt"), p)
+    shutil.copy(os.path.join(ROOT, "kb", "fewshots.json"), f)
+    kb = PromptKB(p, f, {"LOJA": "Loja Teste", "CONSULTOR": "Fulano"}, "padrão", check_interval=0)
+    a, b = kb.prefix(), kb.prefix()
+    if a is not b: erros.append("arquivo igual gerou prefixo novo")
+    if "{{" in a.system: erros.append("variável sem substituir no system prompt")
+    time.sleep(0.01)
+    with open(p, "a", encoding="utf-8") as out: out.write("\nLinha nova.")
+    c, d = kb.prefix(), kb.prefix()
+    if c.version != a.version + 1 or c is not d: erros.append("mudança no prompt não recarregou uma vez só")
+    with open(f, "w", encoding="utf-8") as out: out.write("[{")
+    if kb.prefix() is not c: erros.append("few-shots quebrados derrubaram o último prefixo bom")
+    shutil.rmtree(tmp, ignore_errors=True)
+    print(f"reload: versões {a.version} -> {c.version}, erros de parse {kb.stats()['errors']}")
+    return erros
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--conversas", type=int, default=20)
+    ap.add_argument("--turnos", type=int, default=4)
+    args = ap.parse_args()
+    erros = checar_requests(args.conversas, args.turnos) + checar_reload()
+    for e in erros: print("FALHOU:", e)
+    print("ok" if not erros else f"{len(erros)} falha(s)")
+    sys.exit(1 if erros else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+# breaker.py
+import time, logging, threading
+from collections import deque
+from typing import Callable
+
+log = logging.getLogger("fiat-whatsapp")
+
+
+class CircuitOpenError(Exception):
+    """Circuito aberto: a chamada nem foi feita (o chamador usa o fallback)."""
+
+
+class CircuitBreaker:
+    """
+    Disjuntor para um serviço externo (OpenAI), compartilhado por todas as chamadas do processo:
+    - janela das últimas `window` chamadas; com `min_calls` ou mais e taxa de erro >= `error_rate`
+      o circuito ABRE e as chamadas falham na hora (CircuitOpenError) por `open_seconds`;
+    - depois disso fica MEIO-ABERTO: deixa passar `half_open_calls` chamadas de teste;
+      sucesso fecha, falha reabre;
+    - timeout adaptativo: `factor` x p95 da latência das chamadas bem-sucedidas, entre
+      `timeout_min` e o teto de cada chamador (o timeout fixo de antes). A latência é medida
+      por `tag` (tipo de chamada: resposta, saudação, resumo...): um resumo de 2 s não pode
+      esticar o timeout de uma resposta de 1 s, nem o contrário.
+    """
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, name: str, window: int = 20, min_calls: int = 5, error_rate: float = 0.5,
+                 open_seconds: float = 30, half_open_calls: int = 1, timeout_min: float = 1.5,
+                 factor: float = 2.0):
+        self.name = name
+        self.min_calls, self.error_rate, self.open_seconds = min_calls, error_rate, open_seconds
+        self.half_open_calls, self.timeout_min, self.factor = max(1, half_open_calls), timeout_min, factor
+        self._lock = threading.Lock()
+        self._results = deque(maxlen=max(1, window))   # True/False das últimas chamadas
+        self._window = max(1, window)
+        self._latencies = {}  # tag -> deque de seg, só das que deram certo
+        self._state, self._opened_at, self._trials = self.CLOSED, 0.0, 0
+        self._transitions = deque(maxlen=20)
+        self._stats = {"calls": 0, "failures": 0, "short_circuits": 0, "opened": 0}
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state
+
+    def timeout(self, ceiling: float, tag: str = "default") -> float:
+        with self._lock:
+            p95 = self._p95(tag)
+        if p95 is None: return ceiling
+        return round(min(ceiling, max(self.timeout_min, p95 * self.factor)), 2)
+
+    def call(self, fn: Callable[[float], object], ceiling: float, tag: str = "default"):
+        """Roda `fn(timeout)` se o circuito deixar; registra resultado e latência (na `tag`)."""
+        self._acquire()
+        t0 = time.perf_counter()
+        try:
+            out = fn(self.timeout(ceiling, tag))
+        except Exception:
+            self._record(False, None, tag)
+            raise
+        self._record(True, time.perf_counter() - t0, tag)
+        return out
+
+    def stats(self) -> dict:
+        with self._lock:
+            n = len(self._results)
+            return dict(self._stats, name=self.name, state=self._state,
+                        window_calls=n, window_error_rate=round(self._results.count(False) / n, 3) if n else None,
+                        latency={tag: {"n": len(lat), "p50_ms": self._pct_ms(lat, 0.50),
+                                       "p95_ms": self._pct_ms(lat, 0.95)}
+                                 for tag, lat in self._latencies.items()},
+                        transitions=list(self._transitions))
+
+    # ---- interno (com self._lock) ----
+    def _acquire(self):
+        with self._lock:
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.open_seconds:
+                self._move(self.HALF_OPEN)
+            if self._state == self.CLOSED:
+                return
+            if self._state == self.HALF_OPEN and self._trials < self.half_open_calls:
+                self._trials += 1
+                return
+            self._stats["short_circuits"] += 1
+        raise CircuitOpenError(self.name)
+
+    def _record(self, ok: bool, latency, tag: str):
+        with self._lock:
+            self._stats["calls"] += 1
+            if not ok: self._stats["failures"] += 1
+            if latency is not None:
+                self._latencies.setdefault(tag, deque(maxlen=self._window)).append(latency)
+            if self._state == self.HALF_OPEN:
+                self._trials = max(0, self._trials - 1)
+                if ok:
+                    self._results.clear()
+                    self._move(self.CLOSED)
+                else:
+                    self._open()
+                return
+            self._results.append(ok)
+            n = len(self._results)
+            if (self._state == self.CLOSED and n >= self.min_calls
+                    and self._results.count(False) / n >= self.error_rate):
+                self._open()
+
+    def _open(self):
+        self._opened_at = time.monotonic()
+        self._stats["opened"] += 1
+        self._move(self.OPEN)
+
+    def _move(self, novo: str):
+        if novo == self._state: return
+        self._transitions.append({"at": time.strftime("%Y-%m-%dT%H:%M:%S"), "from": self._state, "to": novo})
+        log.warning(f"Circuito {self.name}: {self._state} -> {novo}")
+        self._state, self._trials = novo, 0
+
+    def _p95(self, tag: str):
+        lat = self._latencies.get(tag, ())
+        if len(lat) < self.min_calls: return None
+        lat = sorted(lat)
+        return lat[min(len(lat) - 1, int(len(lat) * 0.95))]
+
+    @staticmethod
+    def _pct_ms(lat, q: float):
+        if not lat: return None
+        lat = sorted(lat)
+        return round(lat[min(len(lat) - 1, int(len(lat) * q))] * 1000, 1)
@@ -1,6 +1,20 @@
 # catalog.py
-import os, re, json, logging
-from typing import List, Dict
+import os, re, json, logging, threading, time, math, heapq, unicodedata
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from typing import List, Dict, Optional, NamedTuple
+
+from intents import classify
+
+try:
+    import numpy as np
+except ImportError:  # sem numpy a correção de digitação só fica desligada
+    np = None
+
+try:
+    from wordfreq import zipf_frequency
+except ImportError:  # sem o léxico o corretor fica mais restrito (ver OfferFuzzyMatcher)
+    zipf_frequency = None
 
 log = logging.getLogger("fiat-whatsapp")
 
@@ -16,6 +30,145 @@ def load_offers(offers_path: str) -> List[Dict]:
         log.error(f"Erro lendo {offers_path}: {e}")
         return []
 
+# --------- Cache em memória (snapshot + hot reload) ----------
+class CatalogSnapshot:
+    """Versão já parseada do ofertas.json. Imutável: ninguém deve mexer nas ofertas."""
+    __slots__ = ("ofertas", "version", "mtime_ns", "size", "loaded_at", "index", "ranker",
+                 "filtros", "fuzzy", "respostas", "destaques", "fatos")
+
+    def __init__(self, ofertas, version: int, mtime_ns=None, size=None):
+        self.ofertas = tuple(ofertas)
+        self.index = OfferIndex(self.ofertas)
+        self.ranker = OfferRanker(self.ofertas)
+        self.filtros = OfferFilterIndex(self.ofertas)
+        self.fuzzy = OfferFuzzyMatcher(self.filtros.vocabulario(), self.ranker.vocabulario()) if np is not None else None
+        # textos prontos: respostas[i][intencao] e o bloco de destaques da intenção "lista"
+        self.respostas = tuple(_render_respostas(o) for o in self.ofertas)
+        self.destaques = _render_destaques(self.ofertas)
+        self.fatos = tuple(_render_fato(o) for o in self.ofertas)  # 1 linha por oferta p/ o prompt da IA
+        self.version = version
+        self.mtime_ns = mtime_ns
+        self.size = size
+        self.loaded_at = time.time()
+
+    def resposta(self, i: int, intencao: str) -> Optional[str]:
+        r = self.respostas[i]
+        return r.get(intencao) or r.get("detalhes")
+
+class OfferCatalog:
+    """
+    Holder do catálogo por processo:
+    - parseia o arquivo uma vez e serve o snapshot da memória;
+    - checa mtime/size no máximo a cada `check_interval` segundos;
+    - troca o snapshot inteiro (atribuição atômica) quando o arquivo muda;
+    - se o arquivo novo vier malformado, segue servindo o último snapshot bom.
+    """
+    def __init__(self, path: str, check_interval: float = 2.0):
+        self.path = path
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._snap: Optional[CatalogSnapshot] = None
+        self._next_check = 0.0
+        self._bad_key = None  # (mtime_ns, size) do último arquivo que falhou no parse
+        self._version = 0
+        self._stats = {
+            "loads": 0, "reloads": 0, "errors": 0, "checks": 0,
+            "last_load_ms": None, "total_load_ms": 0.0, "last_error": None,
+        }
+
+    def snapshot(self) -> CatalogSnapshot:
+        snap = self._snap
+        if snap is not None and time.monotonic() < self._next_check:
+            return snap
+        with self._lock:
+            now = time.monotonic()
+            if self._snap is None or now >= self._next_check:
+                self._next_check = now + self.check_interval
+                self._refresh()
+            return self._snap
+
+    def reload(self) -> CatalogSnapshot:
+        """Força a checagem do arquivo agora (ignora o rate limit)."""
+        with self._lock:
+            self._next_check = time.monotonic() + self.check_interval
+            self._refresh()
+            return self._snap
+
+    def stats(self) -> dict:
+        snap = self._snap
+        out = dict(self._stats)
+        out.update({
+            "path": self.path,
+            "version": snap.version if snap else None,
+            "offers": len(snap.ofertas) if snap else 0,
+            "loaded_at": snap.loaded_at if snap else None,
+        })
+        return out
+
+    def _refresh(self):
+        self._stats["checks"] += 1
+        try:
+            st = os.stat(self.path)
+            key = (st.st_mtime_ns, st.st_size)
+        except FileNotFoundError:
+            key = None
+
+        snap = self._snap
+        cur = (snap.mtime_ns, snap.size) if snap is not None and snap.mtime_ns is not None else None
+        if snap is not None and key == cur:
+            return
+        if key is not None and key == self._bad_key:
+            return  # mesmo arquivo quebrado de antes: não reparseia
+
+        if key is None:
+            self._swap([], None, None)
+            return
+
+        t0 = time.perf_counter()
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if not isinstance(data, list):
+                raise ValueError("ofertas.json deve conter uma lista")
+        except Exception as e:
+            self._bad_key = key
+            self._stats["errors"] += 1
+            self._stats["last_error"] = str(e)
+            if snap is not None:
+                log.error(f"Erro lendo {self.path}: {e} (mantendo snapshot v{snap.version})")
+            else:
+                log.error(f"Erro lendo {self.path}: {e}")
+                self._swap([], None, None)
+            return
+
+        self._bad_key = None
+        self._swap(data, *key)
+        ms = (time.perf_counter() - t0) * 1000  # parse + montagem do snapshot (índices, ranker, respostas)
+        self._stats["last_load_ms"] = round(ms, 3)
+        self._stats["total_load_ms"] += ms
+        log.info(f"Catálogo carregado: {len(data)} ofertas em {ms:.1f} ms (v{self._version})")
+
+    def _swap(self, ofertas, mtime_ns, size):
+        self._stats["reloads" if self._snap is not None else "loads"] += 1
+        self._version += 1
+        self._snap = CatalogSnapshot(ofertas, self._version, mtime_ns, size)
+
+_catalogs: Dict[str, OfferCatalog] = {}
+_catalogs_lock = threading.Lock()
+
+def get_catalog(offers_path: str, check_interval: Optional[float] = None) -> OfferCatalog:
+    cat = _catalogs.get(offers_path)
+    if cat is None:
+        with _catalogs_lock:
+            cat = _catalogs.get(offers_path)
+            if cat is None:
+                cat = OfferCatalog(offers_path, 2.0 if check_interval is None else check_interval)
+                _catalogs[offers_path] = cat
+    return cat
+
+def catalog_stats() -> dict:
+    return {path: cat.stats() for path, cat in list(_catalogs.items())}
+
 # --------- Utils ----------
 def fmt_brl(valor) -> str:
     if valor is None: return "indisponível"
@@ -28,25 +181,524 @@ def fmt_brl(valor) -> str:
 def tokenize(text: str):
     return re.findall(r"[a-z0-9\.]+", (text or "").lower().replace(",", "."))
 
-def score_offer(q_tokens, offer):
+def _campos_busca(offer) -> Optional[str]:
     try:
-        campos = " ".join([
+        return " ".join([
             offer.get("modelo",""), offer.get("versao",""),
             offer.get("motor",""), offer.get("cambio",""),
             " ".join(offer.get("tags",[])), " ".join(offer.get("publico_alvo",[])),
             " ".join(offer.get("condicoes",[]))
         ]).lower()
-        return sum(1 for t in q_tokens if t in campos)
     except Exception:
-        return 0
+        return None
+
+def _campos_identidade(offer) -> Optional[str]:
+    """Só o que identifica a oferta (sem condições/público-alvo, cheios de palavras genéricas)."""
+    try:
+        return " ".join([
+            offer.get("modelo",""), offer.get("versao",""), offer.get("motor",""), offer.get("cambio",""),
+            " ".join(offer.get("tags",[])),
+        ]).lower()
+    except Exception:
+        return None
+
+def score_offer(q_tokens, offer):
+    campos = _campos_busca(offer)
+    if campos is None: return 0
+    return sum(1 for t in q_tokens if t in campos)
 
 def buscar_oferta(query: str, ofertas: List[Dict]):
+    # varredura linear (referência); no fluxo do webhook usar snapshot.index.buscar
     if not ofertas: return None
     q = tokenize(query)
     if not q: return None
     best = max(ofertas, key=lambda o: score_offer(q, o))
     return best if score_offer(q, best) > 0 else None
 
+# --------- Índice invertido (por snapshot) ----------
+_WORD_RE = re.compile(r"[a-z0-9\.]+")
+
+class _SuffixVocab:
+    """Palavra -> ids com busca por substring: todos os sufixos de todas as palavras, ordenados."""
+    def __init__(self, postings: dict):
+        self._words = list(postings)
+        self._postings = [postings[w] for w in self._words]
+        pares = sorted((w[k:], j) for j, w in enumerate(self._words) for k in range(len(w)))
+        self._sufixos = [s for s, _ in pares]
+        self._palavra = [j for _, j in pares]
+
+    def ids_com(self, token: str) -> frozenset:
+        if not token: return frozenset()
+        # sufixos que começam com o token = palavras que contêm o token ("\x7f" > qualquer [a-z0-9.])
+        lo = bisect_left(self._sufixos, token)
+        hi = bisect_left(self._sufixos, token + "\x7f", lo)
+        ids = set()
+        for j in {self._palavra[k] for k in range(lo, hi)}:
+            ids.update(self._postings[j])
+        return frozenset(ids)
+
+class OfferIndex:
+    """
+    Índice palavra -> ids de ofertas, montado uma vez por snapshot.
+    Mantém a semântica de substring do score_offer: um token da busca só tem
+    [a-z0-9.], então ele está no texto da oferta sse for substring de alguma
+    "palavra" (sequência máxima de [a-z0-9.]) desse texto; ex.: "1.3" em "1.3 turbo 270".
+    As palavras que contêm o token saem de um array de sufixos ordenado (bisect): custo
+    O(log sufixos + palavras que casam), sem varrer o vocabulário. A expansão token -> ids
+    fica num memo LRU.
+    A busca "significativa" (último recurso do bot) não usa substring: só palavras inteiras,
+    sem acento, dos campos de identidade ("horário" não casa "utilitário" por causa do "rio").
+    """
+    _MEMO_MAX = 4096
+
+    def __init__(self, ofertas):
+        self._ofertas = ofertas
+        self._vocab = _SuffixVocab(self._montar(ofertas, _campos_busca))
+        self._ident = {}
+        for i, o in enumerate(ofertas):
+            campos = _campos_identidade(o)
+            if campos is None: continue
+            for w in set(tokenize_folded(campos)):
+                self._ident.setdefault(w, set()).add(i)
+        self._memo = OrderedDict()
+        self._memo_lock = threading.Lock()
+
+    @staticmethod
+    def _montar(ofertas, campos_de) -> dict:
+        postings = {}
+        for i, o in enumerate(ofertas):
+            campos = campos_de(o)
+            if campos is None: continue
+            for w in set(_WORD_RE.findall(campos)):
+                postings.setdefault(w, []).append(i)
+        return {w: tuple(ids) for w, ids in postings.items()}
+
+    def ids_para(self, token: str) -> frozenset:
+        hit = self._memo.get(token)
+        if hit is not None:
+            try: self._memo.move_to_end(token)
+            except KeyError: pass  # despejada por outro thread entre o get e o move
+            return hit
+        hit = self._vocab.ids_com(token)
+        with self._memo_lock:
+            self._memo[token] = hit
+            if len(self._memo) > self._MEMO_MAX: self._memo.popitem(last=False)
+        return hit
+
+    def buscar(self, query: str):
+        """Mesmo resultado de buscar_oferta(query, ofertas), inclusive no desempate."""
+        i = self.buscar_id(query)
+        return None if i is None else self._ofertas[i]
+
+    def buscar_id(self, query: str, significativos: bool = False) -> Optional[int]:
+        """`significativos`: palavras inteiras sem acento (tokenize_folded), sem stopwords nem tokens
+        com menos de 3 caracteres, e só nos campos de identidade (modelo/versão/motor/câmbio/tags):
+        "taxa", "usado" e "carro" das condições e do público-alvo casavam com quase toda oferta."""
+        if significativos:
+            q = [t for t in tokenize_folded(query) if len(t) >= 3 and t not in STOPWORDS]
+            postings = lambda t: self._ident.get(t, ())
+        else:
+            q, postings = tokenize(query), self.ids_para
+        if not q: return None
+        scores = {}
+        for t in q:
+            for i in postings(t):
+                scores[i] = scores.get(i, 0) + 1
+        if not scores: return None
+        top = max(scores.values())
+        return min(i for i, sc in scores.items() if sc == top)
+
+# --------- Busca ranqueada (BM25F) ----------
+def fold(text: str) -> str:
+    """minúsculas e sem acento: 'Automático' -> 'automatico'"""
+    nfkd = unicodedata.normalize("NFKD", (text or "").lower())
+    return "".join(ch for ch in nfkd if not unicodedata.combining(ch))
+
+_FOLD_TOKEN_RE = re.compile(r"[a-z0-9]+(?:[.,][0-9]+)*")
+
+def tokenize_folded(text: str):
+    return [t.replace(",", ".") for t in _FOLD_TOKEN_RE.findall(fold(text))]
+
+# palavras de ligação que só geram match espúrio
+STOPWORDS = frozenset("""
+a o as os e de da do das dos em no na nos nas um uma uns umas para pra pro por com sem
+que qual quais quanto quanta me te se eu voce voces vc vcs ele ela isso esse essa este esta
+ai la aqui ja ta tem ter tenho quero queria gostaria saber sobre mais menos muito ou
+""".split())
+
+# peso de cada campo no score (modelo/tags valem mais que condições)
+FIELD_WEIGHTS = {
+    "modelo": 3.0, "tags": 2.5, "versao": 2.0, "motor": 1.2,
+    "cambio": 1.0, "combustivel": 1.0, "publico_alvo": 1.0, "condicoes": 0.5,
+}
+# campos que dizem QUAL é a oferta: um hit com corte de score precisa casar pelo menos um deles
+IDENTITY_FIELDS = ("modelo", "versao", "tags")
+
+def _field_text(v) -> str:
+    if v is None: return ""
+    if isinstance(v, (list, tuple)): return " ".join(str(x) for x in v if x is not None)
+    return str(v)
+
+class OfferRanker:
+    """
+    BM25F sobre os campos das ofertas, montado uma vez por snapshot.
+    Acentos são dobrados na indexação; a contribuição de cada (termo, oferta)
+    já sai pré-calculada, então a consulta só soma postings.
+    Com `min_score` > 0 (match "com confiança"), a oferta também precisa casar algum termo
+    de IDENTITY_FIELDS: palavras genéricas das condições/público-alvo ("carro usado") somam
+    score, mas sozinhas não apontam uma oferta.
+    """
+    K1 = 1.2
+    B = 0.75
+
+    def __init__(self, ofertas):
+        self._ofertas = ofertas
+        n = len(ofertas)
+        campos_tokens = []  # [ {campo: [tokens]} ]
+        soma_len = {f: 0 for f in FIELD_WEIGHTS}
+        for o in ofertas:
+            por_campo = {}
+            if isinstance(o, dict):
+                for f in FIELD_WEIGHTS:
+                    toks = tokenize_folded(_field_text(o.get(f)))
+                    por_campo[f] = toks
+                    soma_len[f] += len(toks)
+            campos_tokens.append(por_campo)
+        avg_len = {f: (soma_len[f] / n if n else 0) or 1.0 for f in FIELD_WEIGHTS}
+
+        wtf = {}  # termo -> {id: tf ponderado e normalizado por campo}
+        ident = {}  # termo -> ids em que ele aparece em IDENTITY_FIELDS
+        for i, por_campo in enumerate(campos_tokens):
+            for f, toks in por_campo.items():
+                if not toks: continue
+                if f in IDENTITY_FIELDS:
+                    for t in toks: ident.setdefault(t, set()).add(i)
+                norm = 1 - self.B + self.B * len(toks) / avg_len[f]
+                w = FIELD_WEIGHTS[f] / norm
+                for t in toks:
+                    d = wtf.setdefault(t, {})
+                    d[i] = d.get(i, 0.0) + w
+
+        self._postings = {}
+        for t, docs in wtf.items():
+            idf = math.log(1 + (n - len(docs) + 0.5) / (len(docs) + 0.5))
+            self._postings[t] = tuple((i, idf * x / (self.K1 + x)) for i, x in docs.items())
+        self._ident = {t: frozenset(ids) for t, ids in ident.items()}
+
+    def vocabulario(self):
+        return self._postings.keys()
+
+    def top(self, query: str, k: int = 3, min_score: float = 0.0):
+        """[(oferta, score)] em ordem decrescente, só acima de min_score."""
+        return [(self._ofertas[i], sc) for i, sc in self.top_ids(query, k, min_score)]
+
+    def top_ids(self, query: str, k: int = 3, min_score: float = 0.0):
+        termos = {t for t in tokenize_folded(query) if t not in STOPWORDS}
+        scores = {}
+        for t in termos:
+            for i, c in self._postings.get(t, ()):
+                scores[i] = scores.get(i, 0.0) + c
+        if min_score > 0:
+            ok = set()
+            for t in termos: ok.update(self._ident.get(t, ()))
+            scores = {i: sc for i, sc in scores.items() if i in ok}
+        if not scores: return []
+        melhores = heapq.nlargest(k, scores.items(), key=lambda it: (it[1], -it[0]))
+        return [(i, round(sc, 4)) for i, sc in melhores if sc >= min_score]
+
+# score mínimo para considerar que a mensagem citou uma oferta com clareza
+# (calibrado no catálogo atual: nome de modelo ~1.4+); além do score, o hit precisa casar
+# modelo/versão/tags (ver OfferRanker): "carro usado" chegava a 1.31 só com condições
+MIN_SCORE = 1.2
+
+def buscar_ofertas(query: str, ofertas_path: str, k: int = 3, min_score: Optional[float] = None):
+    snap = get_catalog(ofertas_path).snapshot()
+    return snap.ranker.top(query, k, MIN_SCORE if min_score is None else min_score)
+
+# --------- Filtros estruturados (preço + atributos) ----------
+FILTER_FIELDS = ("combustivel", "cambio", "tags", "publico_alvo")
+
+# sinônimos/flexões comuns no WhatsApp -> termo indexado (já sem acento)
+FILTER_SYNONYMS = {
+    "automatica": "automatico", "automaticos": "automatico", "automaticas": "automatico", "auto": "automatico",
+    "pickup": "picape", "caminhonete": "picape", "picapes": "picape",
+    "suvs": "suv", "hatches": "hatch", "sedans": "sedan", "seda": "sedan",
+    "familias": "familia", "economicos": "economico", "economica": "economico",
+}
+# palavras de valores compostos ("Primeiro carro", "Aventura leve") que não filtram nada sozinhas
+FILTER_IGNORE = frozenset("carro carros primeiro leve pequena ruas cidades irregulares litoraneas visual marchas app".split())
+
+# número inteiro (sem cortar "60x" em "6" nem "0,99%" em "0") + "mil"/"k" opcional, recusando
+# unidades que não são preço: parcelas, %, lugares, km...
+_NUM = (r"(r\$\s*)?(\d+(?:[.,]\d+)*)(?!\d|[.,]\d)(?:\s*(mil|k)\b)?"
+        r"(?!\s*(?:%|(?:x|vezes|parcelas?|prestac\w*|lugar(?:es)?|km|kms|meses|mes|anos?|cv|hp|portas|marchas"
+        r"|pessoas|dias|horas|litros|kg)\b))")
+_PRECO_RE = re.compile(
+    r"\b(ate|abaixo de|menos de|no maximo|maximo|max|acima de|mais de|a partir de|entre)\s+" + _NUM
+    + r"(?:\s*(?:e|a)\s*" + _NUM + r")?"
+)
+# "bônus de até 10 mil", "entrada a partir de 20 mil no usado": valor de outra coisa, não do carro
+_PRECO_NAO_CARRO_ANTES = re.compile(
+    r"\b(bonus|desconto|entrada|parcela|parcelas|prestacao|taxa|juros|seguro|cashback|usado|troca|"
+    r"salario|renda|km|quilometragem)\b[^0-9]{0,12}$")
+_PRECO_NAO_CARRO_DEPOIS = re.compile(r"\s*(?:n[oa]|de|do|da|em)\s+(?:usado|troca|entrada|desconto|bonus|parcela)")
+_MAIS_BARATO_RE = re.compile(r"mais barat|menor preco|mais em conta|mais acessive")
+_MAIS_CARO_RE = re.compile(r"mais caro|mais cara|maior preco")
+
+PRECO_PLAUSIVEL = (20_000, 5_000_000)  # faixa de preço de carro; fora disso o número é outra coisa
+
+def _valor_reais(num: str, sufixo: Optional[str], moeda: bool = False) -> Optional[float]:
+    """Valor em reais, ou None se o número não parece preço de carro."""
+    if sufixo:  # "120 mil", "120,5 mil", "150k"
+        inteiro, _, frac = num.replace(",", ".").partition(".")
+        return float(f"{inteiro}.{frac.replace('.', '') or 0}") * 1000
+    v = float(re.sub(r"[.,]", "", num))
+    lo, hi = PRECO_PLAUSIVEL
+    if v < 1000 and (moeda or lo <= v * 1000 <= hi):
+        return v * 1000  # "até 200" / "até R$ 120" = mil
+    return v if moeda or lo <= v <= hi else None
+
+def _preco_num(o) -> float:
+    try:
+        return float(_preco_ordem(o))
+    except Exception:
+        return 9e9
+
+class Filtro(NamedTuple):
+    preco_min: Optional[float]
+    preco_max: Optional[float]
+    attrs: tuple              # termos pedidos (todos precisam bater, em qualquer dos FILTER_FIELDS)
+    ordem: int                # 1 = mais barato primeiro, -1 = mais caro primeiro
+    superlativo: bool         # "mais barata"/"mais cara": devolve só 1
+    cita_modelo: bool         # a mensagem cita modelo/versão (aí a busca ranqueada decide)
+    atributo_forte: bool      # algum termo é de combustível/câmbio/tag (não só público-alvo, "entrega")
+
+    @property
+    def forte(self) -> bool:
+        # preço/superlativo deixam claro que é um pedido de lista filtrada
+        return self.preco_min is not None or self.preco_max is not None or self.superlativo
+
+    @property
+    def vazio(self) -> bool:
+        return not self.forte and not self.attrs
+
+class OfferFilterIndex:
+    """
+    Índices por snapshot para consultas tipo "diesel até 200 mil":
+    - preços ordenados (bisect para faixas);
+    - conjuntos de ids por termo de combustivel/cambio/tags/publico_alvo.
+    """
+    def __init__(self, ofertas):
+        self._preco = [_preco_num(o) if isinstance(o, dict) else 9e9 for o in ofertas]
+        ordem = sorted(range(len(ofertas)), key=lambda i: (self._preco[i], i))
+        self._ids_por_preco = ordem
+        self._precos = [self._preco[i] for i in ordem]
+
+        attrs = {f: {} for f in FILTER_FIELDS}
+        modelos = set()
+        rotulo, rotulo_exato = {}, {}  # termo -> texto original para exibir ("Diesel", "automático")
+        for i, o in enumerate(ofertas):
+            if not isinstance(o, dict): continue
+            for f in FILTER_FIELDS:
+                for valor in (o.get(f) if isinstance(o.get(f), list) else [o.get(f)]):
+                    if not valor: continue
+                    valor = str(valor)
+                    toks = set(tokenize_folded(valor))
+                    for t in toks:
+                        if len(t) < 3 or t in STOPWORDS or t in FILTER_IGNORE or t[0].isdigit(): continue
+                        attrs[f].setdefault(t, set()).add(i)
+                        rotulo.setdefault(t, t)
+                        if len(toks) == 1: rotulo_exato.setdefault(t, valor)
+            for f in ("modelo", "versao"):
+                modelos.update(tokenize_folded(_field_text(o.get(f))))
+
+        # um índice por campo; a consulta usa a união por termo (diesel em tags OU combustivel)
+        self._attrs = {f: {t: frozenset(ids) for t, ids in d.items()} for f, d in attrs.items()}
+        self._por_termo = {}
+        for d in self._attrs.values():
+            for t, ids in d.items():
+                self._por_termo[t] = self._por_termo.get(t, frozenset()) | ids
+        self._rotulo = {**rotulo, **rotulo_exato}
+        self._fortes = frozenset(self._attrs["combustivel"]) | frozenset(self._attrs["cambio"]) | frozenset(self._attrs["tags"])
+        # nomes de modelo/versão ("pulse", "ranch"), menos termos técnicos de câmbio/combustível
+        tecnicos = set(self._attrs["cambio"]) | set(self._attrs["combustivel"]) | {"fiat"}
+        self._modelos = frozenset(
+            t for t in modelos
+            if len(t) >= 3 and not t[0].isdigit() and t not in STOPWORDS and t not in tecnicos
+        )
+
+    def parse(self, mensagem: str) -> Filtro:
+        s = fold(mensagem)
+        preco_min = preco_max = None
+        for m in _PRECO_RE.finditer(s):
+            if _PRECO_NAO_CARRO_ANTES.search(s, 0, m.start()) or _PRECO_NAO_CARRO_DEPOIS.match(s, m.end()):
+                continue
+            op, v1 = m.group(1), _valor_reais(m.group(3), m.group(4), bool(m.group(2)))
+            if v1 is None: continue
+            if op == "entre":
+                v2 = _valor_reais(m.group(6), m.group(7) or m.group(4), bool(m.group(5) or m.group(2))) \
+                    if m.group(6) else None
+                if v2 is None: continue
+                preco_min, preco_max = min(v1, v2), max(v1, v2)
+            elif op in ("acima de", "mais de", "a partir de"):
+                preco_min = v1
+            else:
+                preco_max = v1
+            break
+
+        caro = bool(_MAIS_CARO_RE.search(s))
+        barato = bool(_MAIS_BARATO_RE.search(s))
+
+        attrs, cita_modelo = [], False
+        for t in tokenize_folded(s):
+            t = FILTER_SYNONYMS.get(t, t)
+            if t in self._modelos or (t.endswith("s") and t[:-1] in self._modelos):
+                cita_modelo = True
+            termo = t if t in self._por_termo else (t[:-1] if t.endswith("s") and t[:-1] in self._por_termo else None)
+            if termo and termo not in attrs:
+                attrs.append(termo)
+        return Filtro(preco_min, preco_max, tuple(attrs), -1 if caro and not barato else 1, caro or barato,
+                      cita_modelo, any(t in self._fortes for t in attrs))
+
+    def filtrar(self, filtro: Filtro, limit: int = 3) -> List[int]:
+        cand = None
+        for t in sorted(filtro.attrs, key=lambda t: len(self._por_termo.get(t, ()))):
+            ids = self._por_termo.get(t, frozenset())
+            cand = ids if cand is None else cand & ids
+            if not cand: return []
+
+        lo = 0 if filtro.preco_min is None else bisect_left(self._precos, filtro.preco_min)
+        hi = len(self._precos) if filtro.preco_max is None else bisect_right(self._precos, filtro.preco_max)
+        if filtro.preco_max is None:  # sem teto, oferta sem preço (9e9) não entra em lista de preço
+            hi = bisect_left(self._precos, 9e9) if filtro.forte else hi
+        if lo >= hi: return []
+
+        if cand is not None and len(cand) < hi - lo:
+            # poucos candidatos: ordena só eles
+            lo_p, hi_p = self._precos[lo], self._precos[hi - 1]
+            ids = [i for i in cand if lo_p <= self._preco[i] <= hi_p]
+            ids.sort(key=lambda i: (self._preco[i], i), reverse=filtro.ordem < 0)
+            return ids[:limit]
+
+        faixa = range(lo, hi) if filtro.ordem > 0 else range(hi - 1, lo - 1, -1)
+        out = []
+        for pos in faixa:
+            i = self._ids_por_preco[pos]
+            if cand is None or i in cand:
+                out.append(i)
+                if len(out) >= limit: break
+        return out
+
+    def descrever(self, filtro: Filtro) -> str:
+        partes = [self._rotulo.get(t, t) for t in filtro.attrs]
+        if filtro.preco_min is not None and filtro.preco_max is not None:
+            partes.append(f"entre {fmt_brl(filtro.preco_min)} e {fmt_brl(filtro.preco_max)}")
+        elif filtro.preco_max is not None:
+            partes.append(f"até {fmt_brl(filtro.preco_max)}")
+        elif filtro.preco_min is not None:
+            partes.append(f"a partir de {fmt_brl(filtro.preco_min)}")
+        return ", ".join(partes)
+
+    def vocabulario(self) -> frozenset:
+        """nomes de modelo/versão + tags: o que vale a pena corrigir por digitação"""
+        return self._modelos | frozenset(self._attrs["tags"])
+
+# --------- Correção de digitação (n-gramas, NumPy) ----------
+def _trigramas(termo: str) -> set:
+    t = f"#{termo}#"
+    return {t[i:i + 3] for i in range(len(t) - 2)}
+
+def _distancia(a: str, b: str, limite: int) -> int:
+    """Levenshtein com transposição (OSA); para de contar ao passar de `limite`."""
+    if abs(len(a) - len(b)) > limite: return limite + 1
+    ant2, ant = None, list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        cur = [i] + [0] * len(b)
+        for j, cb in enumerate(b, 1):
+            cur[j] = min(ant[j] + 1, cur[j - 1] + 1, ant[j - 1] + (ca != cb))
+            if i > 1 and j > 1 and ca == b[j - 2] and a[i - 2] == cb:
+                cur[j] = min(cur[j], ant2[j - 2] + 1)
+        if min(cur) > limite: return limite + 1
+        ant2, ant = ant, cur
+    return ant[-1]
+
+class OfferFuzzyMatcher:
+    """
+    Corrige erro de digitação ("fastbak", "stradda", "pulsi") contra os nomes do catálogo.
+    Cada nome vira um vetor binário de trigramas normalizado (linhas de uma matriz
+    NumPy); os termos desconhecidos da mensagem são pontuados contra todos os nomes
+    num único produto de matrizes (similaridade de cosseno).
+    Só os `CANDIDATOS` mais parecidos viram correção, e só se parecerem digitação de verdade:
+    mesma primeira letra e distância de edição <= 1 (<= 2 em nomes longos, com léxico).
+    Palavra que existe em português ("moro", "estrada", "limite", "pulso") nunca é
+    trocada: o léxico é o wordfreq (opcional); sem ele a distância fica em 1.
+    """
+    MIN_SIM = 0.5
+    MIN_LEN = 4
+    CANDIDATOS = 3
+    NOME_LONGO = 8          # nomes a partir daqui aceitam 2 edições
+    ZIPF_PALAVRA = 2.5      # frequência (escala Zipf do wordfreq) a partir da qual é palavra real
+    _MEMO_MAX = 4096
+
+    def __init__(self, nomes, conhecidos=()):
+        self.nomes = sorted(n for n in set(nomes) if len(n) >= self.MIN_LEN and not n[0].isdigit())
+        self._conhecidos = frozenset(conhecidos) | frozenset(nomes)
+        self._gram_id = {}
+        linhas, cols = [], []
+        for r, nome in enumerate(self.nomes):
+            for g in _trigramas(nome):
+                linhas.append(r)
+                cols.append(self._gram_id.setdefault(g, len(self._gram_id)))
+        m = np.zeros((len(self.nomes), len(self._gram_id)), dtype=np.float32)
+        m[linhas, cols] = 1.0
+        if len(self.nomes):
+            m /= np.linalg.norm(m, axis=1, keepdims=True)
+        self._mt = np.ascontiguousarray(m.T)
+        self._memo = {}  # termo -> correção (ou None)
+
+    def _alvo(self, t: str) -> bool:
+        return (len(t) >= self.MIN_LEN and not t[0].isdigit() and t not in STOPWORDS
+                and t not in self._conhecidos)
+
+    def _digitacao(self, t: str, nome: str) -> bool:
+        if t[0] != nome[0]: return False
+        limite = 2 if len(nome) >= self.NOME_LONGO and zipf_frequency is not None else 1
+        return _distancia(t, nome, limite) <= limite
+
+    def _palavra_real(self, t: str, originais) -> bool:
+        if zipf_frequency is None: return False
+        return any(zipf_frequency(w, "pt") >= self.ZIPF_PALAVRA for w in {t, *originais.get(t, ())})
+
+    def corrigir(self, mensagem: str, veicular: bool = False) -> Optional[str]:
+        """Mensagem com os termos corrigidos, ou None se nada mudou. Só mexe quando a
+        mensagem já fala de carro (`veicular`) ou o termo é a mensagem inteira ("fastbak?")."""
+        if not self.nomes: return None
+        toks = tokenize_folded(mensagem)
+        if not veicular and len({t for t in toks if t not in STOPWORDS}) != 1: return None
+        novos = [t for t in dict.fromkeys(toks) if self._alvo(t) and t not in self._memo]
+        if novos:
+            q = np.zeros((len(novos), len(self._gram_id)), dtype=np.float32)
+            for r, t in enumerate(novos):
+                grams = _trigramas(t)
+                cols = [self._gram_id[g] for g in grams if g in self._gram_id]
+                q[r, cols] = 1.0 / math.sqrt(len(grams))
+            sims = q @ self._mt
+            top = np.argsort(-sims, axis=1)[:, :self.CANDIDATOS]
+            if len(self._memo) + len(novos) > self._MEMO_MAX: self._memo.clear()
+            for r, t in enumerate(novos):
+                self._memo[t] = next((self.nomes[c] for c in top[r]
+                                      if sims[r, c] >= self.MIN_SIM and self._digitacao(t, self.nomes[c])), None)
+
+        trocas = {t: self._memo[t] for t in toks if self._memo.get(t)}
+        if not trocas: return None
+        # o termo pode ser palavra de verdade fora do catálogo; confere com a grafia original (acentos)
+        originais = {}
+        for w in re.findall(r"\w+", (mensagem or "").lower()):
+            originais.setdefault(fold(w), set()).add(w)
+        trocas = {t: n for t, n in trocas.items() if not self._palavra_real(t, originais)}
+        if not trocas: return None
+        return " ".join(trocas.get(t, t) for t in toks)
+
 # --------- Formatação / Intenções ----------
 def titulo_oferta(o: dict) -> str:
     return f"{o.get('modelo','').strip()} {o.get('versao','').strip()}".strip()
@@ -75,14 +727,7 @@ def montar_texto_oferta(o: dict) -> str:
     return "\n".join(linhas)
 
 def detectar_intencao(msg: str) -> str:
-    s = (msg or "").lower()
-    if any(k in s for k in ["link", "site", "url"]): return "link"
-    if any(k in s for k in ["preço", "preco", "valor", "quanto custa"]): return "preco"
-    if any(k in s for k in ["condição", "condicoes", "condição", "parcel", "financi", "taxa"]): return "condicoes"
-    if any(k in s for k in ["público", "publico", "perfil", "para quem"]): return "publico"
-    if any(k in s for k in ["ficha", "detalhe", "detalhes", "resumo", "informação"]): return "detalhes"
-    if any(k in s for k in ["oferta", "ofertas", "promo", "promoção", "promocao", "lista", "listar"]): return "lista"
-    return "detalhes"
+    return classify(msg).catalog
 
 def formatar_resposta_por_intencao(intencao: str, o: dict):
     if not o:
@@ -109,29 +754,137 @@ def formatar_resposta_por_intencao(intencao: str, o: dict):
 
     return montar_texto_oferta(o)
 
-def tentar_responder_com_catalogo(mensagem: str, ofertas_path: str):
+# --------- Pré-renderização (por snapshot) ----------
+INTENCOES = ("link", "preco", "condicoes", "publico", "detalhes")
+
+def _preco_ordem(o):
+    return o.get("preco_por") or o.get("preco_a_partir") or o.get("preco_de") or 9e9
+
+def _render_respostas(o) -> dict:
+    try:
+        return {it: formatar_resposta_por_intencao(it, o) for it in INTENCOES}
+    except Exception as e:
+        log.error(f"Oferta inválida no catálogo ({e}): {o!r:.120}")
+        return {}
+
+def _render_destaques(ofertas) -> Optional[str]:
+    try:
+        destaques = heapq.nsmallest(3, ofertas, key=_preco_ordem)
+        cards = [montar_texto_oferta(o) for o in destaques]
+    except Exception as e:
+        log.error(f"Falha montando destaques do catálogo: {e}")
+        return None
+    return "Algumas ofertas em destaque:\n\n" + "\n\n---\n\n".join(cards) if cards else None
+
+def _render_fato(o) -> Optional[str]:
+    """Oferta numa linha compacta (o modelo lê como fato; sem a chamada para ação dos cards)."""
+    try:
+        preco = o.get("preco_por") or o.get("preco_a_partir") or o.get("preco_de")
+        preco_label = "por" if o.get("preco_por") else ("a partir de" if o.get("preco_a_partir") else "de")
+        partes = [titulo_oferta(o), f"{preco_label} {fmt_brl(preco)}"]
+        tecnico = ", ".join(o[k] for k in ("motor", "cambio", "combustivel") if o.get(k))
+        if tecnico: partes.append(tecnico)
+        if o.get("condicoes"): partes.append("; ".join(o["condicoes"]))
+        lp = link_preferencial(o)
+        if lp: partes.append(lp)
+        return "- " + " | ".join(partes)
+    except Exception as e:
+        log.error(f"Oferta inválida no catálogo ({e}): {o!r:.120}")
+        return None
+
+def _responder_filtrado(snap: "CatalogSnapshot", filtro: Filtro) -> str:
+    ids = snap.filtros.filtrar(filtro, limit=1 if filtro.superlativo else 3)
+    desc = snap.filtros.descrever(filtro)
+    if not ids:
+        return f"Não encontrei ofertas {desc} no momento. Quer que eu te mostre as opções mais próximas?"
+    if filtro.superlativo:
+        cab = ("A mais barata" if filtro.ordem > 0 else "A mais cara") + (f" ({desc})" if desc else "") + ":"
+    else:
+        cab = f"Opções {desc}:" if desc else "Algumas opções:"
+    return cab + "\n\n" + "\n\n---\n\n".join(snap.resposta(i, "detalhes") for i in ids)
+
+def _so_atributos(filtro: Filtro, intencao: str, veicular: bool) -> bool:
+    """Lista filtrada só por atributos, sem modelo citado: "tem diesel?", "opções para família".
+    Um termo de público-alvo sozinho ("entrega", "viagem") só vale se a mensagem pedir lista
+    ou falar de carro; senão "quanto tempo demora a entrega?" virava lista de utilitários."""
+    if not filtro.attrs or filtro.cita_modelo: return False
+    return filtro.atributo_forte or intencao == "lista" or veicular
+
+def _responder_por_match(snap: "CatalogSnapshot", mensagem: str, filtro: Filtro, intencao: str, min_score: float,
+                         veicular: bool = False):
+    if _so_atributos(filtro, intencao, veicular):
+        return _responder_filtrado(snap, filtro)
+    hits = snap.ranker.top_ids(mensagem, k=1, min_score=min_score)
+    return snap.resposta(hits[0][0], intencao) if hits else None
+
+def fatos_relevantes(mensagem: str, ofertas_path: str, recentes=(), k: int = 3,
+                     min_score: float = MIN_SCORE) -> List[str]:
+    """
+    Linhas de fato das até `k` ofertas mais relevantes para a conversa, na ordem de relevância:
+    filtros de preço/atributo da mensagem, depois o ranker na mensagem (e na versão com
+    digitação corrigida) e, para completar, nas mensagens `recentes` (da mais nova para a mais velha).
+    """
+    snap = get_catalog(ofertas_path).snapshot()
+    if not snap.ofertas or k <= 0:
+        return []
+    ids = []
+    def add(novos):
+        for i in novos:
+            if i not in ids and len(ids) < k and snap.fatos[i]: ids.append(i)
+    it = classify(mensagem)
+    filtro = snap.filtros.parse(mensagem)
+    if filtro.forte or _so_atributos(filtro, it.catalog, it.vehicle):
+        add(snap.filtros.filtrar(filtro, limit=k))
+    consultas = [mensagem]
+    corrigida = snap.fuzzy.corrigir(mensagem, it.vehicle) if snap.fuzzy else None
+    if corrigida: consultas.append(corrigida)
+    consultas += list(recentes)
+    for q in consultas:
+        if len(ids) >= k: break
+        add(i for i, _ in snap.ranker.top_ids(q, k, min_score))
+    return [snap.fatos[i] for i in ids]
+
+def tentar_responder_com_catalogo(mensagem: str, ofertas_path: str, min_score: float = MIN_SCORE,
+                                  intencao: Optional[str] = None, veicular: Optional[bool] = None):
     """
     CONSERVADOR:
     - Se pedir 'ofertas/lista', mostra destaques.
-    - Senão, só responde se houver match claro de modelo (buscar_oferta).
+    - Se pedir faixa de preço / "mais barata" (ou atributos sem modelo claro), lista filtrada.
+    - Senão, só responde se houver match claro de modelo (busca ranqueada acima de
+      min_score; depois a mesma busca com erros de digitação corrigidos; por último,
+      o match por substring de sempre).
     - Se não houver match, retorna None -> IA conversa normalmente.
     """
-    ofertas = load_offers(ofertas_path)
+    snap = get_catalog(ofertas_path).snapshot()
+    ofertas = snap.ofertas
     if not ofertas:
         return None
 
-    intencao = detectar_intencao(mensagem)
+    if intencao is None or veicular is None:
+        it = classify(mensagem)
+        intencao = intencao or it.catalog
+        veicular = it.vehicle if veicular is None else veicular
+
+    filtro = snap.filtros.parse(mensagem)
+    if filtro.forte or (intencao == "lista" and filtro.attrs):
+        return _responder_filtrado(snap, filtro)
 
     if intencao == "lista":
-        destaques = sorted(
-            ofertas,
-            key=lambda o: (o.get("preco_por") or o.get("preco_a_partir") or o.get("preco_de") or 9e9)
-        )[:3]
-        cards = [montar_texto_oferta(o) for o in destaques]
-        return "Algumas ofertas em destaque:\n\n" + "\n\n---\n\n".join(cards)
+        return snap.destaques
 
-    o = buscar_oferta(mensagem, ofertas)
-    if not o:
+    resp = _responder_por_match(snap, mensagem, filtro, intencao, min_score, veicular)
+    if resp:
+        return resp
+
+    # erro de digitação ("fastbak", "stradda"): corrige pelos n-gramas e tenta de novo
+    corrigida = snap.fuzzy.corrigir(mensagem, veicular) if snap.fuzzy else None
+    if corrigida:
+        resp = _responder_por_match(snap, corrigida, snap.filtros.parse(corrigida), intencao, min_score, veicular)
+        if resp:
+            return resp
+
+    i = snap.index.buscar_id(mensagem, significativos=True)  # match por substring de sempre
+    if i is None:
         return None  # deixa a IA responder
 
-    return formatar_resposta_por_intencao(intencao, o)
+    return snap.resposta(i, intencao)
@@ -0,0 +1,104 @@
+# context.py
+import queue, logging, threading
+from typing import List, Optional
+
+try:
+    import tiktoken
+except ImportError:  # sem tiktoken a contagem vira estimativa (~4 caracteres por token)
+    tiktoken = None
+
+log = logging.getLogger("fiat-whatsapp")
+
+MSG_OVERHEAD = 4  # tokens de papel/separador por mensagem no formato de chat
+
+_enc = None
+_enc_lock = threading.Lock()
+
+def _encoder():
+    global _enc
+    if _enc is None and tiktoken is not None:
+        with _enc_lock:
+            if _enc is None:
+                try: _enc = tiktoken.get_encoding("o200k_base")
+                except Exception:  # sem rede para baixar o vocabulário: fica na estimativa
+                    log.warning("tiktoken indisponível; contando tokens por estimativa")
+                    _enc = False
+    return _enc or None
+
+def count_tokens(text: str) -> int:
+    enc = _encoder()
+    if enc: return len(enc.encode(text or ""))
+    return (len(text or "") + 3) // 4
+
+def message_tokens(messages) -> int:
+    return sum(count_tokens(m.get("content")) + MSG_OVERHEAD for m in messages)
+
+def summary_message(summary: str) -> dict:
+    return {"role": "system", "content": f"Resumo da conversa até aqui: {summary}"}
+
+def fact_block(fatos: List[str], budget: int) -> Optional[dict]:
+    """Linhas de fato do catálogo (mais relevante primeiro) numa mensagem de sistema de até `budget` tokens."""
+    cab = "Ofertas do catálogo ligadas a esta conversa (use só estes dados para preço, condições e links):"
+    usado, linhas = count_tokens(cab) + MSG_OVERHEAD, []
+    for f in fatos:
+        t = count_tokens(f) + 1
+        if usado + t > budget: break
+        usado += t; linhas.append(f)
+    return {"role": "system", "content": cab + "\n" + "\n".join(linhas)} if linhas else None
+
+def fit_history(historico: List[dict], budget: int, max_turns: int, summary: Optional[str] = None):
+    """
+    Divide o histórico em (mantidas, antigas): as mensagens mais recentes que cabem em `budget`
+    tokens (junto com o resumo) e em `max_turns`; a última mensagem fica sempre.
+    As antigas saem do histórico e vão para o resumo.
+    """
+    usado = count_tokens(summary) + MSG_OVERHEAD if summary else 0
+    corte = len(historico)
+    for i in range(len(historico) - 1, -1, -1):
+        t = count_tokens(historico[i].get("content")) + MSG_OVERHEAD
+        if corte < len(historico) and (usado + t > budget or len(historico) - i > max_turns):
+            break
+        usado += t
+        corte = i
+    return historico[corte:], historico[:corte]
+
+
+class Summarizer:
+    """
+    Resumo corrido da conversa, atualizado em segundo plano (nunca no caminho da resposta).
+    Um thread só: os resumos de um telefone saem na ordem, cada um partindo do anterior.
+    `summarize(resumo_atual, mensagens) -> novo resumo | None` (chamada ao LLM; None = pulou,
+    ex.: sem cliente ou circuito da OpenAI aberto);
+    `load(phone)` / `save(phone, resumo)` leem e gravam o resumo junto da sessão.
+    """
+    def __init__(self, app, summarize, load, save, queue_max: int = 1000):
+        self.app = app
+        self._summarize, self._load, self._save = summarize, load, save
+        self._q = queue.Queue(maxsize=queue_max)
+        self._stats = {"queued": 0, "done": 0, "dropped": 0, "skipped": 0, "errors": 0}
+        threading.Thread(target=self._run, name="summarizer", daemon=True).start()
+
+    def submit(self, phone: str, antigas: List[dict]):
+        try:
+            self._q.put_nowait((phone, antigas))
+            self._stats["queued"] += 1
+        except queue.Full:
+            self._stats["dropped"] += 1
+
+    def stats(self) -> dict:
+        return dict(self._stats, queue_depth=self._q.qsize())
+
+    def _run(self):
+        while True:
+            phone, antigas = self._q.get()
+            try:
+                with self.app.app_context():
+                    novo = self._summarize(self._load(phone), antigas)
+                    if novo:
+                        self._save(phone, novo)
+                        self._stats["done"] += 1
+                    else:
+                        self._stats["skipped"] += 1
+            except Exception:
+                self._stats["errors"] += 1
+                log.exception(f"Falha ao resumir a conversa de {phone}")
@@ -0,0 +1,65 @@
+# counters.py
+import threading
+from collections import Counter, OrderedDict
+from datetime import datetime
+
+
+class Counters:
+    """
+    Contadores do processo (leads, sessões, agendamentos, hits do catálogo, fallbacks da IA, saudações):
+    - totais semeados uma vez no boot (a partir dos stores) e depois só incrementados;
+    - agregados por hora ("YYYY-MM-DDTHH", hora local do servidor) das últimas `keep_hours` horas.
+    Ler é O(1) nos totais e O(horas) no agregado; nada relê arquivo.
+    """
+    def __init__(self, keep_hours: int = 168):
+        self.keep_hours = keep_hours
+        self._lock = threading.Lock()
+        self._totals = Counter()
+        self._hourly = OrderedDict()  # hora -> Counter (em ordem cronológica)
+        self.started_at = datetime.now().isoformat(timespec="seconds")
+
+    @staticmethod
+    def hour_key(dt: datetime = None) -> str:
+        return (dt or datetime.now()).strftime("%Y-%m-%dT%H")
+
+    def seed(self, name: str, total: int, hourly: dict = None):
+        """Valor inicial de um contador (e, opcionalmente, {hora: n} já agregado no store)."""
+        with self._lock:
+            self._totals[name] = total
+            for hora, n in sorted((hourly or {}).items()):
+                self._bucket(hora)[name] = n
+
+    def incr(self, name: str, n: int = 1):
+        hora = self.hour_key()
+        with self._lock:
+            self._totals[name] += n
+            if n > 0: self._bucket(hora)[name] += n  # o agregado conta eventos; só o total desce
+
+    def reset(self, *names):
+        with self._lock:
+            for name in names:
+                self._totals[name] = 0
+                for c in self._hourly.values(): c.pop(name, None)
+
+    def get(self, name: str) -> int:
+        return self._totals[name]
+
+    def totals(self) -> dict:
+        with self._lock:
+            return dict(self._totals)
+
+    def hourly(self, hours: int = 24) -> list:
+        with self._lock:
+            horas = list(self._hourly.items())[-hours:]
+            return [dict(c, hour=h) for h, c in horas]
+
+    def _bucket(self, hora: str) -> Counter:
+        c = self._hourly.get(hora)
+        if c is None:
+            fora_de_ordem = bool(self._hourly) and hora < next(reversed(self._hourly))  # semente antiga
+            c = self._hourly[hora] = Counter()
+            if fora_de_ordem:
+                self._hourly = OrderedDict(sorted(self._hourly.items()))
+            while len(self._hourly) > self.keep_hours:
+                self._hourly.popitem(last=False)
+        return c
@@ -0,0 +1,142 @@
+# csv_index.py
+import os, csv, threading
+from array import array
+from typing import List, Optional
+
+_CHUNK = 1 << 20
+
+
+class CsvRowIndex:
+    """
+    Índice de offsets das linhas de um CSV que só cresce (append):
+    - varre só os bytes novos desde a última consulta (o arquivo nunca é relido inteiro);
+    - linha termina num \\n fora de aspas (campo com quebra de linha não quebra a linha do CSV);
+    - guarda também as linhas de cada telefone, para o filtro ?phone=;
+    - arquivo apagado/trocado/truncado: recomeça do zero. Truncar no lugar (rotação em
+      segments.py) mantém o inode e o arquivo pode crescer de novo além do offset salvo,
+      então além de inode/tamanho confere os bytes do cabeçalho + 1ª linha (o timestamp
+      da 1ª linha muda a cada rotação).
+    Ler uma página é um seek por linha: o custo depende do tamanho da página, não do histórico.
+    """
+    def __init__(self, path: str, phone_col: str = "telefone"):
+        self.path = path
+        self.phone_col = phone_col
+        self._lock = threading.Lock()
+        self._reset(None)
+
+    def _reset(self, ino):
+        self._ino = ino
+        self._end = 0                 # bytes já indexados (sempre numa fronteira de linha)
+        self._fingerprint = b""       # cabeçalho + 1ª linha de dados, como estavam no disco
+        self._offsets = array("q")    # início de cada linha de dados
+        self._header: List[str] = []
+        self._phone_idx: Optional[int] = None
+        self._by_phone = {}           # telefone -> array de números de linha
+
+    def refresh(self):
+        with self._lock:
+            try:
+                st = os.stat(self.path)
+            except FileNotFoundError:
+                self._reset(None); return
+            if st.st_ino != self._ino or st.st_size < self._end or not self._same_start():
+                self._reset(st.st_ino)
+            if st.st_size > self._end:
+                self._scan(st.st_size)
+
+    def _same_start(self) -> bool:
+        if not self._fingerprint: return True
+        try:
+            with open(self.path, "rb") as f:
+                return f.read(len(self._fingerprint)) == self._fingerprint
+        except FileNotFoundError:
+            return False
+
+    def _scan(self, size: int):
+        with open(self.path, "rb") as f:
+            f.seek(self._end)
+            resto, base = b"", self._end
+            while base + len(resto) < size:
+                bloco = f.read(min(_CHUNK, size - base - len(resto)))
+                if not bloco: break
+                buf = resto + bloco
+                ini, aspas, pos = 0, 0, 0
+                while True:
+                    nl = buf.find(b"\n", pos)
+                    if nl < 0: break
+                    aspas += buf.count(b'"', pos, nl)
+                    pos = nl + 1
+                    if aspas % 2: continue  # \n dentro de um campo entre aspas
+                    self._add_row(base + ini, buf[ini:pos])
+                    ini, aspas = pos, 0
+                resto, base = buf[ini:], base + ini
+            self._end = base  # linha incompleta no fim (writer no meio do flush) fica para a próxima
+
+    def _add_row(self, offset: int, raw: bytes):
+        if not self._header and offset == 0:
+            self._header = _parse(raw)
+            self._phone_idx = self._header.index(self.phone_col) if self.phone_col in self._header else None
+            return
+        n = len(self._offsets)
+        if n == 0: self._fingerprint = self._fingerprint_until(offset + len(raw))
+        self._offsets.append(offset)
+        if self._phone_idx is not None:
+            row = _parse(raw)
+            if len(row) > self._phone_idx:
+                self._by_phone.setdefault(row[self._phone_idx], array("l")).append(n)
+
+    def _fingerprint_until(self, fim: int) -> bytes:
+        with open(self.path, "rb") as f:
+            return f.read(fim)
+
+    @property
+    def header(self) -> List[str]:
+        return list(self._header)
+
+    def count(self, phone: Optional[str] = None) -> int:
+        if phone is None: return len(self._offsets)
+        return len(self._by_phone.get(phone, ()))
+
+    def page(self, page: int = 0, per_page: int = 50, phone: Optional[str] = None):
+        """Linhas da página (0 = mais novas primeiro) e o total de linhas do filtro."""
+        for _ in range(3):
+            self.refresh()
+            rows, total, fp = self._read_page(page, per_page, phone)
+            with self._lock:
+                if fp == self._fingerprint and self._same_start():
+                    return rows, total
+        return [], 0  # arquivo sendo rotacionado sem parar: página vazia em vez de linhas trocadas
+
+    def _read_page(self, page: int, per_page: int, phone: Optional[str]):
+        with self._lock:
+            fp = self._fingerprint
+            ids = self._by_phone.get(phone, array("l")) if phone is not None else None
+            total = len(ids) if ids is not None else len(self._offsets)
+            hi = total - page * per_page
+            lo = max(0, hi - per_page)
+            sel = range(hi - 1, lo - 1, -1) if hi > 0 else range(0)
+            linhas = [ids[i] for i in sel] if ids is not None else list(sel)
+            spans = [(self._offsets[i], self._offsets[i + 1] if i + 1 < len(self._offsets) else self._end)
+                     for i in linhas]
+        rows = []
+        try:
+            with open(self.path, "rb") as f:
+                for ini, fim in spans:
+                    f.seek(ini)
+                    rows.append(_parse(f.read(fim - ini)))
+        except (FileNotFoundError, csv.Error):
+            return [], total, None  # rotacionou entre o refresh e a leitura: o chamador tenta de novo
+        return rows, total, fp
+
+def _parse(raw: bytes) -> List[str]:
+    return next(csv.reader([raw.decode("utf-8", errors="replace").rstrip("\r\n")]), [])
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+def get_csv_index(path: str) -> CsvRowIndex:
+    idx = _indexes.get(path)
+    if idx is None:
+        with _indexes_lock:
+            idx = _indexes.setdefault(path, CsvRowIndex(path))
+    return idx
@@ -0,0 +1,127 @@
+# dispatcher.py
+import time, heapq, queue, logging, threading, zlib
+
+log = logging.getLogger("fiat-whatsapp")
+
+
+class ReplyDispatcher:
+    """
+    Respostas fora do request do webhook:
+    - `submit(phone, body)` só enfileira (fila limitada por worker) e volta na hora;
+    - cada telefone cai sempre no mesmo worker (crc32 do número), então as mensagens
+      de uma conversa são processadas na ordem em que chegaram;
+    - o worker roda `handler(phone, body) -> texto` dentro do app context e entrega com
+      `sender(phone, texto)` (Twilio API);
+    - com `debounce` > 0, mensagens do mesmo telefone que chegam com menos de `debounce` seg
+      entre si (até `debounce_max` desde a 1ª) viram um turno só: `merge(phone, bodies) -> [bodies]`
+      decide como juntar (padrão: uma linha por mensagem) e cada mensagem a menos é uma
+      chamada ao handler (e à IA) economizada.
+    """
+    def __init__(self, app, handler, sender, workers: int = 4, queue_max: int = 1000,
+                 debounce: float = 0.0, debounce_max: float = None, merge=None):
+        self.app = app
+        self._handler = handler
+        self._sender = sender
+        self._merge = merge or (lambda phone, bodies: ["\n".join(bodies)])
+        self.debounce = max(0.0, float(debounce or 0))
+        self.debounce_max = max(self.debounce, float(debounce_max or self.debounce * 4))
+        self._queues = [queue.Queue(maxsize=max(1, int(queue_max))) for _ in range(max(1, int(workers)))]
+        self._lock = threading.Lock()
+        self._due = threading.Condition(self._lock)
+        self._buffers = {}  # telefone -> [mensagens, 1ª chegada, prazo]
+        self._heap = []     # (prazo, telefone)
+        self._stats = {"enqueued": 0, "processed": 0, "rejected": 0, "errors": 0, "send_failures": 0,
+                       "turns": 0, "coalesced": 0, "max_batch": 0,
+                       "max_wait_ms": 0.0, "total_wait_ms": 0.0, "max_handle_ms": 0.0, "total_handle_ms": 0.0}
+        self._threads = [threading.Thread(target=self._run, args=(q,), name=f"reply-worker-{i}", daemon=True)
+                         for i, q in enumerate(self._queues)]
+        if self.debounce:
+            self._threads.append(threading.Thread(target=self._schedule, name="reply-debounce", daemon=True))
+        for t in self._threads: t.start()
+
+    def _queue_for(self, phone: str) -> queue.Queue:
+        return self._queues[zlib.crc32(phone.encode()) % len(self._queues)]
+
+    def submit(self, phone: str, body: str) -> bool:
+        """False = fila cheia (o chamador responde de forma síncrona)."""
+        agora = time.perf_counter()
+        if not self.debounce:
+            try:
+                self._queue_for(phone).put_nowait((phone, [body], agora))
+            except queue.Full:
+                with self._lock: self._stats["rejected"] += 1
+                return False
+            with self._lock: self._stats["enqueued"] += 1
+            return True
+        with self._lock:
+            buf = self._buffers.get(phone)
+            if buf:
+                buf[0].append(body)
+                buf[2] = min(agora + self.debounce, buf[1] + self.debounce_max)
+            elif len(self._buffers) >= sum(q.maxsize for q in self._queues):
+                self._stats["rejected"] += 1
+                return False
+            else:
+                self._buffers[phone] = [[body], agora, agora + self.debounce]
+                heapq.heappush(self._heap, (agora + self.debounce, phone))
+                self._due.notify()
+            self._stats["enqueued"] += 1
+        return True
+
+    def stats(self) -> dict:
+        with self._lock:
+            st = dict(self._stats)
+        n = st["processed"] + st["errors"]
+        tw, th = st.pop("total_wait_ms"), st.pop("total_handle_ms")
+        st["avg_wait_ms"] = round(tw / n, 2) if n else None
+        st["avg_handle_ms"] = round(th / n, 2) if n else None
+        st["calls_saved"] = st.pop("coalesced")
+        st["debounce_s"] = self.debounce
+        st["workers"] = len(self._queues)
+        st["queue_depth"] = [q.qsize() for q in self._queues]
+        st["queue_max"] = self._queues[0].maxsize
+        return st
+
+    def _schedule(self):
+        """Solta o lote de cada telefone para o worker quando o prazo do debounce vence."""
+        while True:
+            with self._lock:
+                while not self._heap: self._due.wait()
+                prazo, phone = self._heap[0]
+                falta = prazo - time.perf_counter()
+                if falta > 0:
+                    self._due.wait(falta); continue
+                heapq.heappop(self._heap)
+                bodies, t_in, novo_prazo = self._buffers[phone]
+                if novo_prazo > prazo:  # chegou mensagem depois: espera mais um pouco
+                    heapq.heappush(self._heap, (novo_prazo, phone)); continue
+                del self._buffers[phone]
+            self._queue_for(phone).put((phone, bodies, t_in))  # worker atrasado segura o agendador (backpressure)
+
+    def _run(self, q):
+        while True:
+            phone, bodies, t_in = q.get()
+            t0 = time.perf_counter()
+            ok = False
+            try:
+                with self.app.app_context():
+                    turnos = self._merge(phone, bodies) if len(bodies) > 1 else bodies
+                    with self._lock:
+                        self._stats["turns"] += len(turnos)
+                        self._stats["coalesced"] += len(bodies) - len(turnos)
+                        self._stats["max_batch"] = max(self._stats["max_batch"], len(bodies))
+                    for body in turnos:
+                        texto = self._handler(phone, body)
+                        if texto and not self._sender(phone, texto):
+                            with self._lock: self._stats["send_failures"] += 1
+                ok = True
+            except Exception:
+                log.exception(f"Erro processando mensagem de {phone} em segundo plano")
+            t1 = time.perf_counter()
+            wait_ms, handle_ms = (t0 - t_in) * 1000, (t1 - t0) * 1000
+            with self._lock:
+                self._stats["processed" if ok else "errors"] += 1
+                self._stats["total_wait_ms"] += wait_ms
+                self._stats["max_wait_ms"] = round(max(self._stats["max_wait_ms"], wait_ms), 2)
+                self._stats["total_handle_ms"] += handle_ms
+                self._stats["max_handle_ms"] = round(max(self._stats["max_handle_ms"], handle_ms), 2)
@@ -0,0 +1,90 @@
+# greeting_pool.py
+import queue, random, logging, threading
+from typing import Callable, Hashable, List, Optional
+
+log = logging.getLogger("fiat-whatsapp")
+
+
+class GreetingPool:
+    """
+    Saudações prontas por chave (saudação, parte do dia), geradas em segundo plano:
+    - `take(key)` sorteia uma frase do pool (microssegundos, sem rede); cada frase vale
+      `max_uses` vezes e depois sai, para o texto não ficar repetitivo;
+    - abaixo de `low` frases a chave entra na fila de reposição; o thread chama
+      `generate(key, n) -> [frases]` (LLM) e guarda só as que passam em `valid(frase)`;
+    - `seed(key) -> [frases]` (templates) enche a chave quando ela está vazia: no boot e
+      quando a geração falha (ex.: sem OpenAI).
+    """
+    def __init__(self, app, keys: List[Hashable], generate: Optional[Callable], seed: Callable,
+                 valid: Callable[[str], bool], size: int = 8, low: int = 3, max_uses: int = 5):
+        self.app = app
+        self.size, self.low, self.max_uses = max(1, size), low, max(1, max_uses)
+        self._generate, self._seed, self._valid = generate, seed, valid
+        self._lock = threading.Lock()
+        self._pool = {k: [] for k in keys}  # chave -> [[frase, usos restantes]]
+        self._pending = set()
+        self._q = queue.Queue()
+        self._stats = {"served": 0, "empty": 0, "refills": 0, "generated": 0, "rejected": 0, "errors": 0}
+        with app.app_context():
+            for k in keys: self._fill(k, self._seed(k))
+        if generate:
+            threading.Thread(target=self._run, name="greeting-pool", daemon=True).start()
+            for k in keys: self._request(k)
+
+    def take(self, key) -> Optional[str]:
+        with self._lock:
+            itens = self._pool.get(key)
+            item = random.choice(itens) if itens else None
+            if item:
+                item[1] -= 1
+                if item[1] <= 0: itens.remove(item)
+            self._stats["served" if item else "empty"] += 1
+            baixo = itens is not None and len(itens) < self.low
+        if baixo: self._request(key)
+        return item[0] if item else None
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._stats, pending=len(self._pending),
+                        sizes={" / ".join(k): len(v) for k, v in self._pool.items()})
+
+    def _fill(self, key, frases: List[str]) -> int:
+        with self._lock:
+            itens = self._pool.setdefault(key, [])
+            novas = 0
+            for f in frases:
+                if len(itens) >= self.size: break
+                if any(f == i[0] for i in itens): continue
+                itens.append([f, self.max_uses]); novas += 1
+            return novas
+
+    def _request(self, key):
+        if not self._generate:
+            # sem gerador: repõe na hora com os templates (é barato)
+            with self.app.app_context(): self._fill(key, self._seed(key))
+            return
+        with self._lock:
+            if key in self._pending: return
+            self._pending.add(key)
+        self._q.put(key)
+
+    def _run(self):
+        while True:
+            key = self._q.get()
+            try:
+                with self.app.app_context():
+                    falta = self.size - len(self._pool.get(key, ()))
+                    frases = self._generate(key, falta) if falta > 0 else []
+                    boas = [f for f in frases if self._valid(f)]
+                    with self._lock:
+                        self._stats["refills"] += 1
+                        self._stats["rejected"] += len(frases) - len(boas)
+                    n = self._fill(key, boas)
+                    with self._lock: self._stats["generated"] += n
+                    if not self._pool.get(key): self._fill(key, self._seed(key))
+            except Exception:
+                with self._lock: self._stats["errors"] += 1
+                log.exception(f"Falha ao repor saudações de {key}")
+                with self.app.app_context(): self._fill(key, self._seed(key))
+            finally:
+                with self._lock: self._pending.discard(key)
@@ -0,0 +1,116 @@
+# intents.py
+import re
+from typing import NamedTuple, Optional
+
+# =========================
+# Palavras-chave (mesmas listas que antes ficavam espalhadas em routes/catalog)
+# =========================
+APPOINTMENT_KWS = ["agendar", "agenda", "marcar", "test drive", "testdrive", "visita", "conhecer o carro"]
+
+VEHICLE_KWS = [
+    "oferta", "ofertas", "promo", "promoção", "promocao",
+    "preço", "preco", "a partir", "por", "link",
+    "agendar", "agenda", "test", "test drive", "modelo",
+    "dispon", "estoque", "cores",
+    "pulse", "toro", "strada", "mobi", "argo", "fastback", "cronos", "fiorino", "ducato"
+]
+
+# ordem = prioridade (a primeira que casar vence)
+CATALOG_KWS = [
+    ("link",      ["link", "site", "url"]),
+    ("preco",     ["preço", "preco", "valor", "quanto custa"]),
+    ("condicoes", ["condição", "condicoes", "parcel", "financi", "taxa"]),
+    ("publico",   ["público", "publico", "perfil", "para quem"]),
+    ("detalhes",  ["ficha", "detalhe", "detalhes", "resumo", "informação"]),
+    ("lista",     ["oferta", "ofertas", "promo", "promoção", "promocao", "lista", "listar"]),
+]
+
+SALUTE_KWS = [("boa noite", "Boa noite"), ("boa tarde", "Boa tarde"), ("bom dia", "Bom dia")]
+
+GREETING_PREFIXES = ("oi", "olá", "ola", "bom dia", "boa tarde", "boa noite", "salve", "eai", "e aí", "boa")
+GREETING_MAX_LEN = 25
+
+_MIRROR_RE = re.compile(r"(oi|ol[aá]|salve|e[ai]?)\b.*")
+
+# =========================
+# Matcher compilado (1 regex, 1 varredura)
+# =========================
+APPOINTMENT, VEHICLE = 1, 2
+_CAT_BIT = {intent: 4 << i for i, (intent, _) in enumerate(CATALOG_KWS)}
+_SAL_BIT = {sal: 4 << (len(CATALOG_KWS) + i) for i, (_, sal) in enumerate(SALUTE_KWS)}
+_CAT_MASK = sum(_CAT_BIT.values())
+_SAL_MASK = sum(_SAL_BIT.values())
+
+def _trie_pattern(words) -> str:
+    """Alternância fatorada por prefixo ("a(?:genda(?:r)?|rgo)"): o sre só testa o ramo da letra certa."""
+    trie = {}
+    for w in words:
+        node = trie
+        for ch in w: node = node.setdefault(ch, {})
+        node[""] = {}
+
+    def emit(node):
+        ramos = [re.escape(ch) + emit(sub) for ch, sub in sorted(node.items()) if ch]
+        if not ramos: return ""
+        corpo = ramos[0] if len(ramos) == 1 else "(?:" + "|".join(ramos) + ")"
+        return f"(?:{corpo})?" if "" in node else corpo  # guloso: o termo mais longo vence
+
+    return emit(trie)
+
+def _build():
+    bits = {}
+    def add(kw, bit): bits[kw] = bits.get(kw, 0) | bit
+    for k in APPOINTMENT_KWS: add(k, APPOINTMENT)
+    for k in VEHICLE_KWS: add(k, VEHICLE)
+    for intent, kws in CATALOG_KWS:
+        for k in kws: add(k, _CAT_BIT[intent])
+    for k, sal in SALUTE_KWS: add(k, _SAL_BIT[sal])
+
+    # A regex devolve só o termo mais longo que começa em cada posição; os mais
+    # curtos que começam ali são prefixos dele, então herdam as flags por aqui.
+    closure = {}
+    for kw in bits:
+        m = 0
+        for other, b in bits.items():
+            if kw.startswith(other): m |= b
+        closure[kw] = m
+
+    # tabelas de prioridade: máscara -> primeira intenção/saudação da lista que casou
+    cat_by_mask = {}
+    for m in range(0, _CAT_MASK + 4, 4):
+        cat_by_mask[m & _CAT_MASK] = next((it for it, _ in CATALOG_KWS if m & _CAT_BIT[it]), "detalhes")
+    sal_by_mask = {}
+    for m in range(0, _SAL_MASK + 1, _SAL_BIT[SALUTE_KWS[0][1]]):
+        sal_by_mask[m & _SAL_MASK] = next((sal for _, sal in SALUTE_KWS if m & _SAL_BIT[sal]), None)
+
+    # lookahead de largura zero: também acha termos que se sobrepõem em posições diferentes
+    return re.compile(f"(?=({_trie_pattern(bits)}))"), closure, cat_by_mask, sal_by_mask
+
+_KW_RE, _KW_BITS, _CAT_BY_MASK, _SAL_BY_MASK = _build()
+
+class Intents(NamedTuple):
+    text: str                 # mensagem normalizada (strip + lower)
+    appointment: bool         # pediu agendamento/test drive
+    vehicle: bool             # fala de carro/oferta (desliga a saudação)
+    greeting: bool            # saudação curta ("oi", "bom dia"...)
+    salute: Optional[str]     # "Bom dia"/"Boa tarde"/"Boa noite" para espelhar
+    salute_generic: bool      # "oi/olá/salve/e aí": espelha com a parte do dia
+    catalog: str              # intenção para o catálogo (link/preco/condicoes/publico/detalhes/lista)
+
+def classify(texto: str) -> Intents:
+    s = (texto or "").strip().lower()
+    mask = 0
+    for kw in _KW_RE.findall(s):
+        mask |= _KW_BITS[kw]
+
+    vehicle = bool(mask & VEHICLE)
+    salute = _SAL_BY_MASK[mask & _SAL_MASK]
+    return Intents(
+        s,
+        bool(mask & APPOINTMENT),
+        vehicle,
+        not vehicle and len(s) <= GREETING_MAX_LEN and s.startswith(GREETING_PREFIXES),
+        salute,
+        salute is None and _MIRROR_RE.fullmatch(s) is not None,
+        _CAT_BY_MASK[mask & _CAT_MASK],
+    )
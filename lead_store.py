@@ -0,0 +1,110 @@
+# lead_store.py
+import sqlite3, threading, logging
+
+log = logging.getLogger("fiat-whatsapp")
+
+COLUMNS = ("timestamp", "telefone", "mensagem", "resposta")
+
+
+class LeadStore:
+    """
+    Cópia consultável do leads.csv em SQLite (WAL), com índice por telefone e por data.
+    O CSV (segmentado, ver segments.py) continua sendo o log; esta tabela recebe os mesmos
+    lotes do CsvLogWriter e é preenchida a partir do log na primeira vez (backfill).
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS leads ("
+            " id INTEGER PRIMARY KEY, ts TEXT NOT NULL, phone TEXT NOT NULL, mensagem TEXT, resposta TEXT)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS leads_phone_ts ON leads (phone, ts)")
+        conn.execute("CREATE INDEX IF NOT EXISTS leads_ts ON leads (ts)")
+        # total de linhas numa tabela de 1 linha, mantido por trigger na mesma transação do
+        # INSERT/DELETE: vale para todos os workers e custa uma leitura por chave (/healthz)
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("CREATE TABLE IF NOT EXISTS totals (name TEXT PRIMARY KEY, n INTEGER NOT NULL)")
+            conn.execute("INSERT OR IGNORE INTO totals (name, n) SELECT 'leads', COUNT(*) FROM leads")
+            conn.execute("CREATE TRIGGER IF NOT EXISTS leads_total_ins AFTER INSERT ON leads"
+                         " BEGIN UPDATE totals SET n = n + 1 WHERE name = 'leads'; END")
+            conn.execute("CREATE TRIGGER IF NOT EXISTS leads_total_del AFTER DELETE ON leads"
+                         " BEGIN UPDATE totals SET n = n - 1 WHERE name = 'leads'; END")
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)  # autocommit
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def insert_rows(self, rows):
+        """Linhas no formato do CSV: [timestamp, telefone, mensagem, resposta]."""
+        conn = self._conn()
+        conn.execute("BEGIN")
+        try:
+            conn.executemany("INSERT INTO leads (ts, phone, mensagem, resposta) VALUES (?, ?, ?, ?)",
+                             (tuple(r[:4]) for r in rows if len(r) >= 4))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def clear(self):
+        self._conn().execute("DELETE FROM leads")
+
+    def total(self) -> int:
+        """Total de leads de todos os workers (linha mantida pelos triggers)."""
+        return self._conn().execute("SELECT n FROM totals WHERE name = 'leads'").fetchone()[0]
+
+    def count(self, phone=None) -> int:
+        if phone: return self._conn().execute("SELECT COUNT(*) FROM leads WHERE phone = ?", (phone,)).fetchone()[0]
+        return self._conn().execute("SELECT COUNT(*) FROM leads").fetchone()[0]
+
+    def backfill(self, rows) -> int:
+        """Importa as linhas do log se a tabela estiver vazia (BEGIN IMMEDIATE: só um worker importa)."""
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if conn.execute("SELECT 1 FROM leads LIMIT 1").fetchone():
+                conn.execute("COMMIT"); return 0
+            n = conn.executemany("INSERT INTO leads (ts, phone, mensagem, resposta) VALUES (?, ?, ?, ?)",
+                                 (tuple(r[:4]) for r in rows if len(r) >= 4)).rowcount
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        if n > 0: log.info(f"Leads importados do log: {n}")
+        return n
+
+    # ---- consultas ----
+    @staticmethod
+    def _where(phone=None, since=None, until=None):
+        cond, params = [], []
+        if phone: cond.append("phone = ?"); params.append(phone)
+        if since: cond.append("ts >= ?"); params.append(since)
+        if until: cond.append("ts < ?"); params.append(until)
+        return (" WHERE " + " AND ".join(cond) if cond else ""), params
+
+    def query(self, phone=None, since=None, until=None, limit: int = 100, offset: int = 0,
+              newest_first: bool = True, as_dict: bool = True):
+        where, params = self._where(phone, since, until)
+        ordem = "DESC" if newest_first else "ASC"
+        sql = (f"SELECT ts, phone, mensagem, resposta FROM leads{where}"
+               f" ORDER BY ts {ordem}, id {ordem} LIMIT ? OFFSET ?")
+        rows = self._conn().execute(sql, params + [int(limit), int(offset)])
+        return [dict(zip(COLUMNS, r)) for r in rows] if as_dict else [list(r) for r in rows]
+
+    def daily_counts(self, since=None, until=None):
+        where, params = self._where(None, since, until)
+        sql = (f"SELECT substr(ts, 1, 10) AS dia, COUNT(*), COUNT(DISTINCT phone) FROM leads{where}"
+               " GROUP BY dia ORDER BY dia")
+        return [{"day": d, "messages": n, "phones": p} for d, n, p in self._conn().execute(sql, params)]
@@ -0,0 +1,139 @@
+# log_writer.py
+import os, csv, time, queue, fcntl, atexit, logging, threading
+
+log = logging.getLogger("fiat-whatsapp")
+
+_STOP = object()
+
+
+class CsvLogWriter:
+    """
+    Escrita assíncrona dos CSVs de log (leads, agendamentos):
+    - o request só enfileira a linha (fila limitada); um thread grava em lotes;
+    - um handle aberto por arquivo; flush a cada `batch_rows` linhas ou `flush_interval` segundos,
+      e no encerramento do processo (atexit);
+    - cada lote grava sob flock (vários workers no mesmo arquivo) e reabre o arquivo se ele
+      foi apagado/trocado (ex.: /reset);
+    - `add_sink(path, fn)`: fn(linhas) recebe cada lote gravado naquele arquivo (ex.: LeadStore);
+    - `set_rotation(path, fn)`: fn(handle) roda sob o flock antes de cada lote e pode truncar o
+      arquivo; o que ela devolver (callable) roda depois do unlock (ex.: SegmentedLog.maybe_rotate);
+    - fila cheia: grava na hora, no próprio request (nada se perde).
+    """
+    def __init__(self, max_queue: int = 10000, batch_rows: int = 200, flush_interval: float = 1.0):
+        self.batch_rows = max(1, int(batch_rows))
+        self.flush_interval = flush_interval
+        self._q = queue.Queue(maxsize=max(1, int(max_queue)))
+        self._files = {}  # path -> handle aberto em append
+        self._sinks = {}  # path -> [fn(linhas)]
+        self._rotation = {}  # path -> fn(handle) -> callable | None
+        self._io_lock = threading.Lock()  # thread de fundo x gravação síncrona
+        self._stats = {"written": 0, "batches": 0, "sync_writes": 0, "rotations": 0, "errors": 0,
+                       "last_flush_ms": 0.0, "max_flush_ms": 0.0, "total_flush_ms": 0.0}
+        self._thread = threading.Thread(target=self._run, name="csv-log-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def write(self, path: str, header: list, row: list):
+        try:
+            self._q.put_nowait((path, header, row))
+        except queue.Full:
+            self._stats["sync_writes"] += 1
+            self._write_batch([(path, header, row)])
+
+    def add_sink(self, path: str, fn):
+        self._sinks.setdefault(path, []).append(fn)
+
+    def set_rotation(self, path: str, fn):
+        self._rotation[path] = fn
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """Bloqueia até tudo que foi enfileirado antes desta chamada estar no disco."""
+        if not self._thread.is_alive(): return True
+        done = threading.Event()
+        self._q.put(done)
+        return done.wait(timeout)
+
+    def close(self, timeout: float = 5.0):
+        if self._thread.is_alive():
+            self._q.put(_STOP)
+            self._thread.join(timeout)
+        with self._io_lock:
+            for f in self._files.values():
+                try: f.close()
+                except Exception: pass
+            self._files.clear()
+
+    def stats(self) -> dict:
+        st = dict(self._stats)
+        st["queue_depth"] = self._q.qsize()
+        st["queue_max"] = self._q.maxsize
+        st["avg_flush_ms"] = round(st.pop("total_flush_ms") / st["batches"], 3) if st["batches"] else None
+        return st
+
+    # ---- thread de fundo ----
+    def _run(self):
+        pending, deadline = [], None
+        while True:
+            timeout = max(0.0, deadline - time.monotonic()) if pending else None
+            try: item = self._q.get(timeout=timeout)
+            except queue.Empty: item = None
+
+            if item is _STOP or isinstance(item, threading.Event):
+                if pending: self._write_batch(pending); pending = []
+                if item is _STOP: return
+                item.set(); continue
+            if item is not None:
+                if not pending: deadline = time.monotonic() + self.flush_interval
+                pending.append(item)
+            if len(pending) >= self.batch_rows or (pending and time.monotonic() >= deadline):
+                self._write_batch(pending); pending = []
+
+    def _write_batch(self, items):
+        por_arquivo = {}
+        for path, header, row in items:
+            por_arquivo.setdefault(path, (header, []))[1].append(row)
+        t0 = time.perf_counter()
+        with self._io_lock:
+            for path, (header, rows) in por_arquivo.items():
+                depois = None
+                try:
+                    f = self._open(path)
+                    fcntl.flock(f, fcntl.LOCK_EX)
+                    try:
+                        rot = self._rotation.get(path)
+                        if rot: depois = rot(f)
+                        w = csv.writer(f)
+                        if os.fstat(f.fileno()).st_size == 0: w.writerow(header)
+                        w.writerows(rows)
+                        f.flush()
+                    finally:
+                        fcntl.flock(f, fcntl.LOCK_UN)
+                    self._stats["written"] += len(rows)
+                    if depois:
+                        self._stats["rotations"] += 1
+                        depois()
+                except Exception:
+                    self._stats["errors"] += 1
+                    log.exception(f"Falha gravando {len(rows)} linha(s) em {path}")
+                    continue
+                for fn in self._sinks.get(path, ()):
+                    try: fn(rows)
+                    except Exception:
+                        self._stats["errors"] += 1
+                        log.exception(f"Falha repassando {len(rows)} linha(s) de {path}")
+            ms = (time.perf_counter() - t0) * 1000
+            self._stats["batches"] += 1
+            self._stats["last_flush_ms"] = round(ms, 3)
+            self._stats["max_flush_ms"] = round(max(self._stats["max_flush_ms"], ms), 3)
+            self._stats["total_flush_ms"] += ms
+
+    def _open(self, path: str):
+        f = self._files.get(path)
+        if f is not None:
+            try:
+                if os.stat(path).st_ino == os.fstat(f.fileno()).st_ino: return f
+            except FileNotFoundError:
+                pass
+            f.close()  # apagado ou trocado: reabre (recria) o arquivo
+        f = self._files[path] = open(path, "a", newline="", encoding="utf-8")
+        return f
@@ -0,0 +1,136 @@
+# prompt_kb.py
+import os, json, time, hashlib, logging, threading
+from typing import Dict, List, Optional, Tuple
+
+log = logging.getLogger("fiat-whatsapp")
+
+
+class PromptPrefix:
+    """
+    Parte fixa do prompt (system + few-shots), montada uma vez por versão dos arquivos.
+    Todas as chamadas usam as MESMAS mensagens, na mesma ordem e com os mesmos bytes:
+    é isso que deixa o provedor reaproveitar o cache de prefixo. Imutável.
+    """
+    __slots__ = ("messages", "version", "digest", "keys", "loaded_at")
+
+    def __init__(self, messages: List[dict], version: int, keys):
+        self.messages = tuple(messages)
+        self.version = version
+        self.keys = keys  # ((mtime_ns, size) do prompt, (mtime_ns, size) dos few-shots)
+        self.digest = hashlib.sha1(serialize(self.messages)).hexdigest()[:12]
+        self.loaded_at = time.time()
+
+    @property
+    def system(self) -> str:
+        return self.messages[0]["content"]
+
+
+def serialize(messages) -> bytes:
+    """Bytes das mensagens como vão para a API (para comparar/medir o prefixo)."""
+    return json.dumps(list(messages), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+class PromptKB:
+    """
+    kb/system_prompt.txt ({{LOJA}}, {{CONSULTOR}}) + kb/fewshots.json ([{role, content}, ...]):
+    - lidos e renderizados uma vez; checa mtime/size no máximo a cada `check_interval` seg;
+    - arquivo novo quebrado: segue com o último prefixo bom (mesma regra do catálogo);
+    - sem system_prompt.txt usa `default_system`.
+    """
+    def __init__(self, prompt_path: str, fewshots_path: str, variables: Dict[str, str],
+                 default_system: str, check_interval: float = 2.0):
+        self.prompt_path, self.fewshots_path = prompt_path, fewshots_path
+        self.variables = dict(variables)
+        self.default_system = default_system
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._prefix: Optional[PromptPrefix] = None
+        self._next_check = 0.0
+        self._bad_keys = None
+        self._version = 0
+        self._stats = {"loads": 0, "reloads": 0, "errors": 0, "last_error": None}
+
+    def prefix(self) -> PromptPrefix:
+        p = self._prefix
+        if p is not None and time.monotonic() < self._next_check:
+            return p
+        with self._lock:
+            now = time.monotonic()
+            if self._prefix is None or now >= self._next_check:
+                self._next_check = now + self.check_interval
+                self._refresh()
+            return self._prefix
+
+    def stats(self) -> dict:
+        p = self._prefix
+        return dict(self._stats, version=p.version if p else None, digest=p.digest if p else None,
+                    fewshots=len(p.messages) - 1 if p else 0,
+                    prefix_bytes=len(serialize(p.messages)) if p else 0)
+
+    @staticmethod
+    def _key(path: str) -> Optional[Tuple[int, int]]:
+        try:
+            st = os.stat(path)
+            return (st.st_mtime_ns, st.st_size)
+        except FileNotFoundError:
+            return None
+
+    def _refresh(self):
+        keys = (self._key(self.prompt_path), self._key(self.fewshots_path))
+        if self._prefix is not None and keys == self._prefix.keys: return
+        if keys == self._bad_keys: return
+        try:
+            messages = [{"role": "system", "content": self._render_system(keys[0])}] + self._load_fewshots(keys[1])
+        except Exception as e:
+            self._bad_keys = keys
+            self._stats["errors"] += 1
+            self._stats["last_error"] = str(e)
+            log.error(f"Erro lendo o prompt da KB: {e}" + (f" (mantendo v{self._prefix.version})" if self._prefix else ""))
+            if self._prefix is None:
+                self._swap([{"role": "system", "content": self.default_system}], keys)
+            return
+        self._bad_keys = None
+        self._swap(messages, keys)
+        log.info(f"Prompt da KB carregado: v{self._version}, {len(messages) - 1} few-shots")
+
+    def _render_system(self, key) -> str:
+        if key is None: return self.default_system
+        with open(self.prompt_path, "r", encoding="utf-8") as f:
+            texto = f.read().strip()
+        for nome, valor in self.variables.items():
+            texto = texto.replace("{{" + nome + "}}", valor)
+        return texto
+
+    def _load_fewshots(self, key) -> List[dict]:
+        if key is None: return []
+        with open(self.fewshots_path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if not isinstance(data, list) or not all(
+                isinstance(m, dict) and m.get("role") in ("user", "assistant") and isinstance(m.get("content"), str)
+                for m in data):
+            raise ValueError("fewshots.json deve ser uma lista de {role: user|assistant, content}")
+        return [{"role": m["role"], "content": m["content"]} for m in data]
+
+    def _swap(self, messages, keys):
+        self._stats["reloads" if self._prefix is not None else "loads"] += 1
+        self._version += 1
+        self._prefix = PromptPrefix(messages, self._version, keys)
+
+_kbs: Dict[tuple, PromptKB] = {}
+_kbs_lock = threading.Lock()
+
+def get_prompt_kb(prompt_path: str, fewshots_path: str, variables: Dict[str, str], default_system: str,
+                  check_interval: Optional[float] = None) -> PromptKB:
+    chave = (prompt_path, fewshots_path, tuple(sorted(variables.items())))
+    kb = _kbs.get(chave)
+    if kb is None:
+        with _kbs_lock:
+            kb = _kbs.get(chave)
+            if kb is None:
+                kb = PromptKB(prompt_path, fewshots_path, variables, default_system,
+                              2.0 if check_interval is None else check_interval)
+                _kbs[chave] = kb
+    return kb
+
+def prompt_kb_stats() -> list:
+    return [kb.stats() for kb in list(_kbs.values())]
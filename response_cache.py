@@ -0,0 +1,54 @@
+# response_cache.py
+import threading
+from typing import Optional
+
+from catalog import tokenize_folded
+from ttl_cache import TTLCache
+
+MAX_KEY_LEN = 160  # mensagens longas quase nunca se repetem: nem entram no cache
+
+
+class ResponseCache:
+    """
+    Respostas da IA para perguntas genéricas de primeiro turno ("vocês abrem sábado?").
+    - chave: texto normalizado (sem acento/caixa/pontuação) + se a conversa é nova;
+      só conversa nova usa o cache (com histórico a resposta depende do contexto);
+    - LRU com TTL (TTLCache);
+    - `generation` (hash do system prompt + versão do catálogo): mudou, o cache é esvaziado.
+    """
+    def __init__(self, max_entries: int, ttl: float):
+        self._cache = TTLCache(max_entries, ttl, sizeof=lambda v: len(v) + 64)
+        self._lock = threading.Lock()
+        self._generation = None
+        self._invalidations = 0
+        self._bypass = 0
+
+    @staticmethod
+    def key(mensagem: str, fresh: bool) -> Optional[tuple]:
+        norm = " ".join(tokenize_folded(mensagem))
+        return (norm, fresh) if norm and len(norm) <= MAX_KEY_LEN else None
+
+    def get(self, mensagem: str, fresh: bool, generation: str) -> Optional[str]:
+        k = self.key(mensagem, fresh) if fresh else None
+        if k is None:
+            with self._lock: self._bypass += 1
+            return None
+        self._check_generation(generation)
+        return self._cache.get(k)
+
+    def put(self, mensagem: str, fresh: bool, generation: str, texto: str):
+        k = self.key(mensagem, fresh) if fresh else None
+        if k is None: return
+        self._check_generation(generation)
+        self._cache[k] = texto
+
+    def _check_generation(self, generation: str):
+        with self._lock:
+            if generation == self._generation: return
+            if self._generation is not None: self._invalidations += 1
+            self._generation = generation
+            self._cache.clear()
+
+    def stats(self) -> dict:
+        return dict(self._cache.stats(), bypass=self._bypass, invalidations=self._invalidations,
+                    generation=self._generation)
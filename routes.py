@@ -1,12 +1,29 @@
 # routes.py
-import os, csv, json, logging, threading, random, re
+import os, io, csv, json, logging, threading, random, time
 from datetime import datetime, timedelta
 from xml.sax.saxutils import escape as xml_escape
-
-from flask import Blueprint, current_app, request, Response, jsonify, render_template_string, abort
-from twilio.rest import Client as TwilioClient
-
-from catalog import tentar_responder_com_catalogo
+from html import escape as html_escape
+from urllib.parse import urlencode
+
+from flask import Blueprint, current_app, request, Response, jsonify, abort
+from twilio.request_validator import RequestValidator
+from twilio_sender import TwilioSender
+
+from catalog import tentar_responder_com_catalogo, get_catalog, catalog_stats, fatos_relevantes
+from intents import classify
+from session_store import SessionStore
+from ttl_cache import TTLCache
+from log_writer import CsvLogWriter
+from csv_index import get_csv_index
+from lead_store import LeadStore, COLUMNS as LEAD_COLUMNS
+from segments import SegmentedLog
+from dispatcher import ReplyDispatcher
+from response_cache import ResponseCache
+from context import Summarizer, fact_block, fit_history, message_tokens, summary_message
+from greeting_pool import GreetingPool
+from breaker import CircuitBreaker, CircuitOpenError
+from prompt_kb import PromptPrefix, get_prompt_kb, prompt_kb_stats
+from counters import Counters
 from calendar_helpers import (
     build_gcal, is_slot_available, create_event, freebusy, business_hours_for
 )
@@ -16,79 +33,121 @@ log = logging.getLogger("fiat-whatsapp")
 _lock = threading.Lock()
 
 # =========================
-# Sessões e leads (arquivos)
+# Sessões (SQLite) e leads (arquivo)
 # =========================
-def _atomic_write(path: str, payload: str):
-    tmp = path + ".tmp"
-    with open(tmp, "w", encoding="utf-8") as f:
-        f.write(payload)
-    os.replace(tmp, path)
-
-def load_sessions_from_file(path: str):
-    if os.path.exists(path):
-        try:
-            with open(path, "r", encoding="utf-8") as f:
-                return json.load(f)
-        except Exception as e:
-            log.error(f"Falha ao carregar {path}: {e}")
-    return {}
-
-def save_sessions(sessions_dict):
-    path = current_app.config["SESSIONS_FILE"]
-    with _lock:
-        _atomic_write(path, json.dumps(sessions_dict, ensure_ascii=False, indent=2))
+def save_session(phone: str, hist):
+    """Persiste só a conversa desse telefone (hist=None apaga). Devolve a nova rev."""
+    if hist is None: session_store.delete(phone); return None
+    return session_store.put(phone, hist)
 
-def save_lead(phone: str, message: str, resposta: str):
-    path = current_app.config["LEADS_FILE"]
-    header = ["timestamp", "telefone", "mensagem", "resposta"]
-    row = [datetime.now().isoformat(), phone, message, resposta]
-    with _lock:
-        new = not os.path.exists(path)
-        with open(path, "a", newline="", encoding="utf-8") as f:
-            w = csv.writer(f)
-            if new: w.writerow(header)
-            w.writerow(row)
+def _hist_bytes(hist) -> int:
+    # estimativa barata: texto + ~120 B de overhead por dict/str de mensagem
+    return sum(len(m.get("content") or "") + 120 for m in hist) + 64
 
-sessions = {}
+def save_lead(phone: str, message: str, resposta: str):
+    counters.incr("leads")
+    log_writer.write(current_app.config["LEADS_FILE"], ["timestamp", "telefone", "mensagem", "resposta"],
+                     [datetime.now().isoformat(), phone, message, resposta])
+
+log_writer: CsvLogWriter = None  # leads/agendamentos: gravação em lote fora do request
+sessions: TTLCache = None  # phone -> (rev, histórico); LRU com TTL, carrega do SQLite no miss
+session_store: SessionStore = None
+lead_store: LeadStore = None
+lead_log: SegmentedLog = None  # leads.csv quente + segmentos .csv.gz arquivados
+reply_dispatcher: ReplyDispatcher = None  # só com ASYNC_REPLY=1 (e Twilio API configurada)
+response_cache: ResponseCache = None  # respostas da IA p/ perguntas de 1º turno (LLM_CACHE_MAX=0 desliga)
+summarizer: Summarizer = None  # resumo corrido das mensagens que saem do histórico (só com OpenAI)
+openai_breaker: CircuitBreaker = None  # todas as chamadas à OpenAI deste processo passam por ele
+twilio_sender: TwilioSender = None  # criado no 1º envio pela API (send_via_twilio_api)
+greeting_pool: GreetingPool = None  # saudações prontas por (saudação, parte do dia); GREETING_POOL_SIZE=0 desliga
+counters = Counters()  # totais e agregados por hora deste processo (semeados no boot)
 @bp.record_once
 def _load_state(setup_state):
-    global sessions
+    global sessions, session_store, log_writer, lead_store, lead_log, reply_dispatcher, response_cache, summarizer, greeting_pool
+    global openai_breaker
     app = setup_state.app
-    sessions = load_sessions_from_file(app.config["SESSIONS_FILE"])
+    log_writer = CsvLogWriter(app.config["LOG_QUEUE_MAX"], app.config["LOG_FLUSH_ROWS"], app.config["LOG_FLUSH_INTERVAL"])
+    lead_log = SegmentedLog(app.config["LEADS_FILE"], app.config["LEADS_ARCHIVE_DIR"],
+                            app.config["LEADS_SEGMENT_MAX_BYTES"], app.config["LEADS_SEGMENT_MAX_AGE"])
+    log_writer.set_rotation(app.config["LEADS_FILE"], lead_log.maybe_rotate)
+    lead_store = LeadStore(app.config["LEADS_DB"])
+    lead_store.backfill(lead_log.iter_rows())  # só se a tabela estiver vazia
+    log_writer.add_sink(app.config["LEADS_FILE"], lead_store.insert_rows)
+    session_store = SessionStore(app.config["SESSIONS_DB"])
+    session_store.migrate_from_json(app.config["SESSIONS_FILE"])  # sessions.json antigo, se existir
+    # com mais de um worker, outro processo pode ter respondido a esse telefone: confere a rev no hit
+    multi = app.config.get("WEB_CONCURRENCY", 1) > 1
+    sessions = TTLCache(app.config["SESSION_CACHE_MAX"], app.config["SESSION_CACHE_TTL"],
+                        loader=session_store.get_versioned, sizeof=lambda v: _hist_bytes(v[1]),
+                        fresh=(lambda phone, v: session_store.rev(phone) == v[0]) if multi else None)
+    openai_breaker = CircuitBreaker(
+        "openai", window=app.config["BREAKER_WINDOW"], min_calls=app.config["BREAKER_MIN_CALLS"],
+        error_rate=app.config["BREAKER_ERROR_RATE"], open_seconds=app.config["BREAKER_OPEN_SECONDS"],
+        timeout_min=app.config["BREAKER_TIMEOUT_MIN"], factor=app.config["BREAKER_TIMEOUT_FACTOR"])
+    if app.config["OPENAI_CLIENT"]:
+        summarizer = Summarizer(app, _resumir, session_store.get_summary, session_store.put_summary)
+    if app.config["GREETING_POOL_SIZE"] > 0:
+        greeting_pool = GreetingPool(
+            app, [(b, p) for b in _SAUDACOES for p in _SAUDACOES],
+            _gerar_para_pool if app.config["OPENAI_CLIENT"] else None,
+            lambda k: _greet_templates(k[0], *_consultor_loja()), _greeting_ok,
+            size=app.config["GREETING_POOL_SIZE"], low=app.config["GREETING_POOL_LOW"],
+            max_uses=app.config["GREETING_POOL_MAX_USES"])
+    if app.config["LLM_CACHE_MAX"] > 0:
+        response_cache = ResponseCache(app.config["LLM_CACHE_MAX"], app.config["LLM_CACHE_TTL"])
+    # aquece o catálogo (parse único; depois só hot reload por mtime/size)
+    get_catalog(app.config["OFFERS_PATH"], app.config.get("CATALOG_RELOAD_INTERVAL")).snapshot()
+    with app.app_context(): prompt_prefix()  # idem para o prompt da KB
+    if app.config.get("ASYNC_REPLY"):
+        if all(app.config.get(k) for k in ("TWILIO_ACCOUNT_SID", "TWILIO_AUTH_TOKEN", "TWILIO_WHATSAPP_FROM")):
+            reply_dispatcher = ReplyDispatcher(app, _process_message, send_via_twilio_api,
+                                               app.config["REPLY_WORKERS"], app.config["REPLY_QUEUE_MAX"],
+                                               app.config["REPLY_DEBOUNCE"], app.config["REPLY_DEBOUNCE_MAX"],
+                                               merge=_coalesce)
+        else:
+            log.warning("ASYNC_REPLY ligado sem credenciais do Twilio: respondendo via TwiML (síncrono)")
+    # contadores do /healthz e /admin/stats: manifest dos segmentos + arquivo quente, depois só incremento
+    desde = Counters.hour_key(datetime.now() - timedelta(hours=counters.keep_hours))
+    horas = lead_log.archived_hours(desde)
+    quentes = 0
+    for r in lead_log.read_hot():  # limitado ao tamanho de um segmento
+        quentes += 1
+        if r[0] >= desde: horas[r[0][:13]] += 1
+    counters.seed("leads", lead_log.archived_rows() + quentes, horas)
+    counters.seed("sessions", session_store.count())
+    appt_idx = get_csv_index(app.config["APPT_FILE"]); appt_idx.refresh()
+    counters.seed("appointments", appt_idx.count())
 
 # =========================
 # Twilio helpers (envio via API)
 # =========================
-def _twilio_client():
-    sid   = current_app.config.get("TWILIO_ACCOUNT_SID")
-    token = current_app.config.get("TWILIO_AUTH_TOKEN")
-    if not (sid and token): return None
-    try: return TwilioClient(sid, token)
-    except Exception:
-        log.exception("Falha ao criar cliente Twilio"); return None
+_twilio_lock = threading.Lock()
+
+def _twilio_sender():
+    """Sender do processo (um Client com pool HTTP); refeito só se as credenciais mudarem."""
+    global twilio_sender
+    cfg = current_app.config
+    chave = (cfg.get("TWILIO_ACCOUNT_SID"), cfg.get("TWILIO_AUTH_TOKEN"), cfg.get("TWILIO_WHATSAPP_FROM"))
+    if not all(chave): return None
+    s = twilio_sender
+    if s is not None and s.credentials == chave: return s
+    with _twilio_lock:
+        if twilio_sender is None or twilio_sender.credentials != chave:
+            try:
+                twilio_sender = TwilioSender(*chave, retries=cfg["TWILIO_MAX_RETRIES"], timeout=cfg["TWILIO_TIMEOUT"])
+            except Exception:
+                log.exception("Falha ao criar cliente Twilio"); return None
+        return twilio_sender
 
 def send_via_twilio_api(to_phone_e164: str, body: str) -> bool:
-    if not current_app.config.get("TWILIO_WHATSAPP_FROM"):
-        return False
-    client = _twilio_client()
-    if not client: return False
-    try:
-        to_fmt = f"whatsapp:{to_phone_e164}" if not str(to_phone_e164).startswith("whatsapp:") else to_phone_e164
-        msg = client.messages.create(
-            from_=current_app.config["TWILIO_WHATSAPP_FROM"],
-            to=to_fmt,
-            body=body
-        )
-        log.info(f"Twilio API enviado: sid={msg.sid}")
-        return True
-    except Exception:
-        log.exception("Falha ao enviar WhatsApp via Twilio API")
-        return False
+    sender = _twilio_sender()
+    if not sender: return False
+    return sender.send(to_phone_e164, body)
 
 # =========================
 # Saudação humana dinâmica (Felipe Fortes, casual)
 # =========================
-_GREET_CACHE = {}  # {phone: datetime}
+_SAUDACOES = ("Bom dia", "Boa tarde", "Boa noite")
 
 def _now_hour(): return datetime.now(current_app.config["TZINFO"]).hour
 def _part_of_day():
@@ -97,39 +156,25 @@ def _part_of_day():
     if h < 18: return "Boa tarde"
     return "Boa noite"
 
-def _mirror_salute(user_text: str) -> str | None:
-    s = (user_text or "").strip().lower()
-    if "boa noite" in s:  return "Boa noite"
-    if "boa tarde" in s:  return "Boa tarde"
-    if "bom dia"   in s:  return "Bom dia"
-    if re.fullmatch(r"(oi|ol[aá]|salve|e[ai]?)\b.*", s): return _part_of_day()
+def _mirror_salute(user_text: str, it=None) -> str | None:
+    it = it or classify(user_text)
+    if it.salute: return it.salute
+    if it.salute_generic: return _part_of_day()
     return None
 
 def _vehicle_intent(s: str) -> bool:
-    s = (s or "").lower()
-    kws = [
-        "oferta", "ofertas", "promo", "promoção", "promocao",
-        "preço", "preco", "a partir", "por", "link",
-        "agendar", "agenda", "test", "test drive", "modelo",
-        "dispon", "estoque", "cores",
-        "pulse", "toro", "strada", "mobi", "argo", "fastback", "cronos", "fiorino", "ducato"
-    ]
-    return any(k in s for k in kws)
+    return classify(s).vehicle
 
 def should_greet(phone: str, minutes: int = 15) -> bool:
-    last = _GREET_CACHE.get(phone)
+    last = session_store.greeted_at(phone)  # compartilhado entre workers
     if not last: return True
-    return datetime.now() - last > timedelta(minutes=minutes)
+    return time.time() - last > minutes * 60
 
 def mark_greeted(phone: str) -> None:
-    _GREET_CACHE[phone] = datetime.now()
+    session_store.mark_greeted(phone)
 
 def is_greeting(texto: str) -> bool:
-    s = (texto or "").strip().lower()
-    if _vehicle_intent(s): return False
-    if len(s) > 25: return False
-    gatilhos = ["oi", "olá", "ola", "bom dia", "boa tarde", "boa noite", "salve", "eai", "e aí", "boa"]
-    return any(s == k or s.startswith(k) for k in gatilhos)
+    return classify(texto).greeting
 
 def _greet_templates(base: str, nome: str, loja: str):
     # Variações curtas, 1 pergunta no final, tom leve
@@ -141,44 +186,62 @@ def _greet_templates(base: str, nome: str, loja: str):
         f"{base}! {nome} – {loja}. Te ajudo com um carro específico ou já mando um top 3 pra começar?",
     ]
 
-def _fallback_greeting(user_text: str) -> str:
-    base = _mirror_salute(user_text) or _part_of_day()
-    nome = current_app.config.get("CONSULTOR_NAME", "Felipe Fortes")
-    loja = current_app.config.get("DEALERSHIP_NAME", "Fiat Globo Itajaí")
-    frases = _greet_templates(base, nome, loja)
+def _consultor_loja():
+    return (current_app.config.get("CONSULTANT_NAME", "Felipe Fortes"),
+            current_app.config.get("DEALERSHIP_NAME", "Fiat Globo Itajaí"))
+
+def _fallback_greeting(user_text: str, it=None) -> str:
+    base = _mirror_salute(user_text, it) or _part_of_day()
+    frases = _greet_templates(base, *_consultor_loja())
     return random.choice(frases)
 
-def human_greeting(user_text: str) -> str:
+def _greeting_ok(text: str) -> bool:
+    return 5 <= len(text.split()) <= 18
+
+def _gerar_saudacoes(user_text: str, n: int = 1, timeout: float = 5, tag: str = "greeting") -> list:
+    """Saudações da IA para a mensagem do cliente (sem validar)."""
     client = current_app.config.get("OPENAI_CLIENT")
     model  = current_app.config.get("OPENAI_MODEL")
-    nome   = current_app.config.get("CONSULTOR_NAME", "Felipe Fortes")
-    loja   = current_app.config.get("DEALERSHIP_NAME", "Fiat Globo Itajaí")
+    if not (client and model): return []
+    nome, loja = _consultor_loja()
+    system = (
+        f"Você é {nome}, consultor da {loja}. Gere uma saudação casual para WhatsApp (pt-BR), "
+        "espelhando a saudação do cliente quando existir (ex.: 'Bom dia!'). "
+        "Use 1 frase curta (6–16 palavras), sem emojis e com UMA pergunta simples (modelo ou ofertas)."
+    )
+    user = f"Mensagem do usuário: {user_text!r}. Gere a saudação."
+    r = openai_breaker.call(lambda t: client.chat.completions.create(
+        model=model, temperature=0.7, n=n,
+        messages=[{"role":"system","content":system},{"role":"user","content":user}],
+        timeout=t
+    ), timeout, tag)
+    return [(c.message.content or "").strip() for c in r.choices]
+
+def _gerar_para_pool(key, n: int) -> list:
+    # o pool roda fora do request: pode esperar mais que o caminho síncrono
+    try:
+        return _gerar_saudacoes(f"{key[0]}!", n, timeout=15, tag="pool")
+    except CircuitOpenError:
+        return []  # o pool segue com os templates até o circuito fechar
+
+def human_greeting(user_text: str, it=None) -> str:
+    if greeting_pool:
+        base = _mirror_salute(user_text, it) or _part_of_day()
+        text = greeting_pool.take((base, _part_of_day()))
+        if text: return text
+        return _fallback_greeting(user_text, it)
     try:
-        if client and model:
-            system = (
-                f"Você é {nome}, consultor da {loja}. Gere uma saudação casual para WhatsApp (pt-BR), "
-                "espelhando a saudação do cliente quando existir (ex.: 'Bom dia!'). "
-                "Use 1 frase curta (6–16 palavras), sem emojis e com UMA pergunta simples (modelo ou ofertas)."
-            )
-            user = f"Mensagem do usuário: {user_text!r}. Gere a saudação."
-            r = client.chat.completions.create(
-                model=model, temperature=0.7,
-                messages=[{"role":"system","content":system},{"role":"user","content":user}],
-                timeout=5
-            )
-            text = (r.choices[0].message.content or "").strip()
-            if 5 <= len(text.split()) <= 18:
-                return text
+        for text in _gerar_saudacoes(user_text):
+            if _greeting_ok(text): return text
     except Exception:
         pass
-    return _fallback_greeting(user_text)
+    return _fallback_greeting(user_text, it)
 
 # =========================
 # IA (prompt humano)
 # =========================
-def system_prompt() -> str:
-    nome = current_app.config.get("CONSULTOR_NAME", "Felipe Fortes")
-    loja = current_app.config.get("DEALERSHIP_NAME", "Fiat Globo Itajaí")
+def _default_system_prompt(nome: str, loja: str) -> str:
+    # usado só se kb/system_prompt.txt não existir
     return (
         f"Você é {nome}, consultor da {loja}, atendendo no WhatsApp. "
         "Responda em tom humano, casual e curto (1–3 frases). "
@@ -188,31 +251,114 @@ def system_prompt() -> str:
         "Convide para test drive quando fizer sentido. Nunca invente preços."
     )
 
+def prompt_prefix() -> PromptPrefix:
+    """System prompt + few-shots da KB: mesmas mensagens (mesmos bytes) em toda chamada até o arquivo mudar."""
+    nome, loja = _consultor_loja()
+    return get_prompt_kb(
+        current_app.config["KB_SYSTEM_PROMPT_PATH"], current_app.config["KB_FEWSHOTS_PATH"],
+        {"CONSULTOR": nome, "LOJA": loja}, _default_system_prompt(nome, loja),
+        current_app.config.get("KB_RELOAD_INTERVAL"),
+    ).prefix()
+
+def system_prompt() -> str:
+    return prompt_prefix().system
+
+def _prompt_generation(prefix: PromptPrefix) -> str:
+    """Muda quando o prompt da KB ou o catálogo mudam (invalida o cache de respostas)."""
+    snap = get_catalog(current_app.config["OFFERS_PATH"], current_app.config.get("CATALOG_RELOAD_INTERVAL")).snapshot()
+    return f"{prefix.digest}:{snap.version if snap else 0}"
+
+def _resumir(resumo: str | None, mensagens: list) -> str | None:
+    """Funde as mensagens que saíram do histórico no resumo da conversa (roda no Summarizer)."""
+    client = current_app.config["OPENAI_CLIENT"]
+    if not client or not mensagens: return None
+    conversa = "\n".join(f"{'Cliente' if m['role'] == 'user' else 'Consultor'}: {m['content']}" for m in mensagens)
+    try:
+        r = openai_breaker.call(lambda t: client.chat.completions.create(
+            model=current_app.config["OPENAI_MODEL"], temperature=0.2, timeout=t,
+            max_tokens=current_app.config["SUMMARY_MAX_TOKENS"],
+            messages=[
+                {"role": "system", "content": (
+                    "Você resume atendimentos de uma concessionária no WhatsApp. Atualize o resumo com as novas "
+                    "mensagens, mantendo só o que ajuda a continuar a conversa: nome do cliente, modelos de interesse, "
+                    "orçamento, cidade, perguntas e combinados pendentes. Texto corrido, no máximo 80 palavras.")},
+                {"role": "user", "content": f"Resumo atual: {resumo or '(vazio)'}\n\nNovas mensagens:\n{conversa}"},
+            ],
+        ), 15, "summary")
+    except CircuitOpenError:
+        return None  # OpenAI degradada: pula este resumo sem poluir o log
+    return (r.choices[0].message.content or "").strip() or None
+
+def _fatos_do_catalogo(mensagem: str, anteriores: list):
+    """Bloco com as ofertas relevantes para a mensagem (e as últimas do cliente), dentro de CATALOG_FACTS_TOKENS."""
+    k, budget = current_app.config["CATALOG_FACTS_K"], current_app.config["CATALOG_FACTS_TOKENS"]
+    if k <= 0 or budget <= 0: return None
+    recentes = [m["content"] for m in reversed(anteriores) if m["role"] == "user"][:2]
+    try:
+        fatos = fatos_relevantes(mensagem, current_app.config["OFFERS_PATH"], recentes, k,
+                                 current_app.config.get("CATALOG_MIN_SCORE", 1.2))
+    except Exception:
+        log.exception("Falha buscando ofertas para o prompt"); return None
+    return fact_block(fatos, budget)
+
 def gerar_resposta(numero: str, mensagem: str) -> str:
-    global sessions
-    historico = sessions.get(numero, [])
+    cached = sessions.get(numero)
+    historico = list(cached[1]) if cached else []
+    resumo = session_store.get_summary(numero) if cached else None
+    fresh = not historico and not resumo  # 1º turno: a resposta não depende de contexto
     historico.append({"role": "user", "content": mensagem})
-    messages = [{"role": "system", "content": system_prompt()}] + historico[-8:]
+    prefix = prompt_prefix()
+    budget, max_turns = current_app.config["CONTEXT_TOKEN_BUDGET"], current_app.config["CONTEXT_MAX_TURNS"]
+    historico, antigas = fit_history(historico, budget, max_turns, resumo)
+    fatos = _fatos_do_catalogo(mensagem, historico[:-1])
+    # prefixo estático primeiro (cacheável no provedor), depois só o que é da conversa;
+    # os fatos do catálogo mudam a cada turno: ficam colados na pergunta, fora do trecho reaproveitável
+    messages = (list(prefix.messages) + ([summary_message(resumo)] if resumo else []) + historico[:-1]
+                + ([fatos] if fatos else []) + historico[-1:])
     client = current_app.config["OPENAI_CLIENT"]
     model  = current_app.config["OPENAI_MODEL"]
     fallback = "Fechado! Você tem algum modelo em mente ou prefere que eu mande as ofertas mais pedidas?"
-    if not client:
+    gen = _prompt_generation(prefix) if response_cache and client else None
+    texto = response_cache.get(mensagem, fresh, gen) if gen else None
+    if texto:
+        counters.incr("ai_cache_hits")
+    elif not client:
         texto = fallback
     else:
+        # tokens do prompt: como era (system + 8 últimas mensagens cruas) x como foi enviado
+        antes = [{"role": "system", "content": prefix.system}] + (list(cached[1]) if cached else [])[-7:] + historico[-1:]
+        counters.incr("prompt_tokens_before", message_tokens(antes))
+        counters.incr("prompt_tokens_after", message_tokens(messages))
+        counters.incr("prompt_calls")
+        if fatos: counters.incr("prompt_fact_blocks")
         try:
-            r = client.chat.completions.create(model=model, messages=messages, temperature=0.7, timeout=8)
+            r = openai_breaker.call(
+                lambda t: client.chat.completions.create(model=model, messages=messages, temperature=0.7, timeout=t),
+                8, "reply")
             texto = (r.choices[0].message.content or "").strip() or fallback
+        except CircuitOpenError:
+            texto = fallback  # OpenAI degradada: responde na hora em vez de esperar o timeout
         except Exception:
             log.exception("Erro ao chamar OpenAI"); texto = fallback
+        if texto is not fallback:
+            counters.incr("ai_replies")
+            if gen: response_cache.put(mensagem, fresh, gen, texto)
+    if texto is fallback: counters.incr("ai_fallbacks")
+    if cached is None: counters.incr("sessions")  # conversa nova
     historico.append({"role": "assistant", "content": texto})
-    sessions[numero] = historico[-12:]
-    save_sessions(sessions)
+    historico, saiu = fit_history(historico, budget, max_turns, resumo)
+    antigas += saiu
+    sessions[numero] = (save_session(numero, historico), historico)
+    if antigas and summarizer: summarizer.submit(numero, antigas)  # fora do caminho da resposta
     return texto
 
 # =========================
 # Agendamento (FSM)
 # =========================
-appointments_state = {}  # { phone: {"step": str, "data": {...}} }
+# estado por telefone no session_store: {"step": str | None, "data": {...}}; step None = fluxo encerrado
+_START_FLOW_MSG = ("Perfeito! Vamos agendar.\n"
+                   "Você prefere **visita ao showroom** ou **test drive**?\n"
+                   "Responda: *visita* ou *test drive*.")
 
 def parse_datetime_br(texto: str):
     t = (texto or "").strip().lower().replace("h", ":")
@@ -222,18 +368,21 @@ def parse_datetime_br(texto: str):
     return None
 
 def wants_appointment(msg: str) -> bool:
-    s = (msg or "").lower()
-    gatilhos = ["agendar", "agenda", "marcar", "test drive", "testdrive", "visita", "conhecer o carro"]
-    return any(g in s for g in gatilhos)
+    return classify(msg).appointment
 
 def start_flow(phone: str):
-    appointments_state[phone] = {"step": "tipo", "data": {"telefone": phone}}
-    return ("Perfeito! Vamos agendar.\n"
-            "Você prefere **visita ao showroom** ou **test drive**?\n"
-            "Responda: *visita* ou *test drive*.")
-
-def step_flow(phone: str, msg: str):
-    st = appointments_state.get(phone, {"step": None, "data": {"telefone": phone}})
+    session_store.put_appointment(phone, {"step": "tipo", "data": {"telefone": phone}})
+    return _START_FLOW_MSG
+
+def step_flow(phone: str, msg: str, st: dict = None):
+    """Avança o agendamento a partir do estado salvo e grava o novo passo (ou encerra)."""
+    st = st or session_store.get_appointment(phone) or {"step": None, "data": {"telefone": phone}}
+    resp = _advance_flow(phone, msg, st)
+    if st["step"] is None: session_store.delete_appointment(phone)
+    else: session_store.put_appointment(phone, st)
+    return resp
+
+def _advance_flow(phone: str, msg: str, st: dict):
     step = st["step"]; data = st["data"]; s = (msg or "").strip()
 
     tzinfo = current_app.config["TZINFO"]
@@ -242,7 +391,7 @@ def step_flow(phone: str, msg: str):
     sa_b64 = current_app.config["GOOGLE_SERVICE_ACCOUNT_B64"]
 
     if s.lower() in ["cancelar", "cancel", "parar", "sair"]:
-        appointments_state.pop(phone, None)
+        st["step"] = None
         return "Agendamento cancelado. Se quiser retomar depois, é só dizer *agendar*."
 
     if step == "tipo":
@@ -298,7 +447,7 @@ def step_flow(phone: str, msg: str):
                 svc = build_gcal(sa_b64, cal_id)
                 start_dt = datetime.fromisoformat(data["start_iso"])
                 if not is_slot_available(svc, start_dt, tzinfo, cal_id, tz):
-                    appointments_state.pop(phone, None)
+                    st["step"] = None
                     return "Esse horário acabou de ficar indisponível. Vamos escolher outro?"
                 event_id, start_dt = create_event(
                     svc, tzinfo=tzinfo, tz=tz, calendar_id=cal_id,
@@ -311,34 +460,30 @@ def step_flow(phone: str, msg: str):
                     "carro": data["carro"], "cidade": data["cidade"],
                     "start_iso": start_dt.isoformat(), "event_id": event_id
                 })
-                appointments_state.pop(phone, None)
+                st["step"] = None
                 return ("Agendamento **confirmado** no calendário! ✅\n"
                         "Obrigado. No dia anterior, te envio uma confirmação por aqui.")
             except Exception:
                 log.exception("Falha ao criar evento no Google Calendar")
-                appointments_state.pop(phone, None)
+                st["step"] = None
                 return "Não consegui concluir no calendário agora. Podemos tentar outro horário?"
         elif s.lower() in ["cancelar", "não", "nao"]:
-            appointments_state.pop(phone, None)
+            st["step"] = None
             return "Sem problemas, cancelei o agendamento. Posso ajudar em algo mais?"
         else:
             return "Por favor, responda *confirmar* ou *cancelar*."
 
-    return start_flow(phone)
+    st["step"], st["data"] = "tipo", {"telefone": phone}
+    return _START_FLOW_MSG
 
 def save_appointment_log(row: dict):
-    path = current_app.config["APPT_FILE"]
-    header = ["timestamp_log", "telefone", "tipo", "nome", "carro", "cidade", "start_iso", "event_id"]
-    with _lock:
-        new = not os.path.exists(path)
-        with open(path, "a", newline="", encoding="utf-8") as f:
-            w = csv.writer(f)
-            if new: w.writerow(header)
-            w.writerow([
-                datetime.now().isoformat(),
-                row.get("telefone",""), row.get("tipo",""), row.get("nome",""), row.get("carro",""),
-                row.get("cidade",""), row.get("start_iso",""), row.get("event_id","")
-            ])
+    counters.incr("appointments")
+    log_writer.write(current_app.config["APPT_FILE"],
+                     ["timestamp_log", "telefone", "tipo", "nome", "carro", "cidade", "start_iso", "event_id"], [
+        datetime.now().isoformat(),
+        row.get("telefone",""), row.get("tipo",""), row.get("nome",""), row.get("carro",""),
+        row.get("cidade",""), row.get("start_iso",""), row.get("event_id","")
+    ])
 
 # =========================
 # Utils HTTP
@@ -354,6 +499,23 @@ def normalize_phone(raw: str) -> str:
     raw = (raw or "").strip()
     return raw[len("whatsapp:"):] if raw.startswith("whatsapp:") else raw
 
+def _twilio_signature_ok() -> bool:
+    """Confere X-Twilio-Signature (HMAC da URL + parâmetros com o auth token). Sem token ou
+    com TWILIO_VALIDATE_SIGNATURE=0 não há o que conferir."""
+    cfg = current_app.config
+    token = cfg.get("TWILIO_AUTH_TOKEN")
+    if not token or not cfg.get("TWILIO_VALIDATE_SIGNATURE", True): return True
+    url = cfg.get("TWILIO_WEBHOOK_URL")
+    if url:
+        url = url.rstrip("/") + request.path
+        if request.query_string: url += "?" + request.query_string.decode("latin-1")
+    else:
+        # atrás de proxy (Render/Heroku) o Twilio assina a URL pública https, não a interna
+        proto = request.headers.get("X-Forwarded-Proto", request.scheme).split(",")[0].strip()
+        host = request.headers.get("X-Forwarded-Host", request.host).split(",")[0].strip()
+        url = f"{proto}://{host}{request.full_path if request.query_string else request.path}"
+    return RequestValidator(token).validate(url, request.form, request.headers.get("X-Twilio-Signature", ""))
+
 def _send_and_http_respond(to_phone_e164: str, text: str) -> Response:
     """Envia via API (se toggle ligado) e sempre responde 200 (sem travar o Twilio)."""
     if current_app.config.get("FORCE_TWILIO_API_REPLY"):
@@ -367,22 +529,95 @@ def _send_and_http_respond(to_phone_e164: str, text: str) -> Response:
 # =========================
 @bp.route("/healthz")
 def healthz():
-    leads_file = current_app.config["LEADS_FILE"]
-    leads_count = 0
-    if os.path.exists(leads_file):
-        try:
-            with open(leads_file, "r", encoding="utf-8") as f:
-                leads_count = max(0, sum(1 for _ in f) - 1)
-        except Exception:
-            leads_count = -1
+    # totais dos stores compartilhados (iguais em qualquer worker): uma leitura por chave em cada
+    # SQLite, sem varrer tabela nem arquivo; sessions_cached é o cache deste processo
     return jsonify({
         "ok": True,
         "model": current_app.config["OPENAI_MODEL"],
-        "sessions": len(sessions),
-        "leads": leads_count,
+        "sessions": session_store.total(),
+        "sessions_cached": len(sessions),
+        "pid": os.getpid(),
+        "leads": lead_store.total(),
         "port": os.getenv("PORT", "5000")
     })
 
+@bp.route("/admin/stats")
+def admin_stats():
+    """Totais do processo e agregados por hora (?hours=, padrão 24)."""
+    require_admin()
+    try: hours = min(counters.keep_hours, max(1, int(request.args.get("hours", 24))))
+    except ValueError: return jsonify({"error": "hours inválido"}), 400
+    return jsonify({"pid": os.getpid(), "since": counters.started_at,
+                    "totals": counters.totals(), "hourly": counters.hourly(hours)})
+
+def _context_stats() -> dict:
+    n = counters.get("prompt_calls")
+    return {
+        "calls": n,
+        "avg_prompt_tokens_before": round(counters.get("prompt_tokens_before") / n, 1) if n else None,
+        "avg_prompt_tokens_after": round(counters.get("prompt_tokens_after") / n, 1) if n else None,
+        "fact_block_rate": round(counters.get("prompt_fact_blocks") / n, 3) if n else None,
+        "summarizer": summarizer.stats() if summarizer else None,
+    }
+
+@bp.route("/admin/metrics")
+def admin_metrics():
+    require_admin()
+    return jsonify({
+        "catalog": catalog_stats(),
+        "sessions": sessions.stats(),
+        "log_writer": log_writer.stats(),
+        "replies": reply_dispatcher.stats() if reply_dispatcher else {"mode": "sync"},
+        "llm_cache": response_cache.stats() if response_cache else None,
+        "context": _context_stats(),
+        "prompt": prompt_kb_stats(),
+        "greetings": greeting_pool.stats() if greeting_pool else None,
+        "openai": dict(openai_breaker.stats(), reply_timeout_s=openai_breaker.timeout(8, "reply")),
+        "twilio": twilio_sender.stats() if twilio_sender else None,
+    })
+
+def _lead_filters():
+    return {"phone": normalize_phone(request.args.get("phone")) or None,
+            "since": request.args.get("since") or None, "until": request.args.get("until") or None}
+
+@bp.route("/admin/leads")
+def admin_leads():
+    """?phone= e/ou ?since=/&until= (ISO, until exclusivo); mais recentes primeiro; ?limit= (máx. 1000)."""
+    require_admin()
+    try: limit = min(1000, max(1, int(request.args.get("limit", 100))))
+    except ValueError: return jsonify({"error": "limit inválido"}), 400
+    return jsonify({"leads": lead_store.query(limit=limit, **_lead_filters())})
+
+@bp.route("/admin/leads/daily")
+def admin_leads_daily():
+    require_admin()
+    f = _lead_filters(); f.pop("phone")
+    return jsonify({"days": lead_store.daily_counts(**f)})
+
+@bp.route("/admin/leads/export")
+def admin_leads_export():
+    """Exporta em streaming (?format=csv|jsonl), com os mesmos filtros de /admin/leads."""
+    require_admin()
+    fmt = request.args.get("format", "csv")
+    rows = lead_log.iter_rows(**_lead_filters())  # só os segmentos do período
+    if fmt == "jsonl":
+        gen = (json.dumps(dict(zip(LEAD_COLUMNS, r)), ensure_ascii=False) + "\n" for r in rows)
+        mimetype = "application/x-ndjson"
+    elif fmt == "csv":
+        def gen():
+            buf = io.StringIO(); w = csv.writer(buf)
+            w.writerow(LEAD_COLUMNS)
+            for r in rows:
+                w.writerow(r)
+                if buf.tell() > 64 * 1024:
+                    yield buf.getvalue(); buf.seek(0); buf.truncate()
+            yield buf.getvalue()
+        gen, mimetype = gen(), "text/csv"
+    else:
+        return jsonify({"error": "format deve ser csv ou jsonl"}), 400
+    return Response(gen, mimetype=mimetype,
+                    headers={"Content-Disposition": f"attachment; filename=leads.{fmt}"})
+
 @bp.route("/slots")
 def slots():
     d_str = request.args.get("date")
@@ -434,40 +669,74 @@ def cron_reminders():
     return jsonify({"ok": True, "sent": enviados})
 
 def _handle_incoming():
+    # antes de qualquer trabalho (e antes de enfileirar): só o Twilio dispara respostas
+    if not _twilio_signature_ok():
+        log.warning("Webhook com X-Twilio-Signature inválida: rejeitado.")
+        return Response("", status=403, mimetype="text/plain")
+
     from_number = normalize_phone(request.form.get("From", ""))
     body = (request.form.get("Body", "") or "").strip()
 
     if not from_number:
         log.warning("Requisição sem From."); return Response("", status=200, mimetype="text/plain")
 
+    # modo assíncrono: só enfileira e devolve 200 vazio; a resposta vai pela API do Twilio
+    if reply_dispatcher is not None and reply_dispatcher.submit(from_number, body):
+        return Response("", status=200, mimetype="text/plain")
+
+    return _send_and_http_respond(from_number, _process_message(from_number, body))
+
+def _process_message(from_number: str, body: str) -> str:
+    """Gera (e registra) a resposta de uma mensagem. Precisa de app context, não de request."""
     if body.upper() == "SAIR":
-        sessions.pop(from_number, None); save_sessions(sessions)
-        appointments_state.pop(from_number, None)
-        return _send_and_http_respond(from_number, "Você foi removido. Quando quiser voltar, é só mandar OI. 👋")
+        sessions.pop(from_number, None)
+        if session_store.delete(from_number): counters.incr("sessions", -1)
+        session_store.delete_appointment(from_number)
+        return "Você foi removido. Quando quiser voltar, é só mandar OI. 👋"
+
+    it = classify(body)  # uma varredura só: todas as flags de roteamento abaixo
 
     # 1) agendamento (prioritário)
-    if wants_appointment(body) or from_number in appointments_state:
-        resp = step_flow(from_number, body) if from_number in appointments_state else start_flow(from_number)
+    appt = session_store.get_appointment(from_number)
+    if it.appointment or appt:
+        resp = step_flow(from_number, body, appt) if appt else start_flow(from_number)
         save_lead(from_number, body, resp)
-        return _send_and_http_respond(from_number, resp)
+        return resp
 
     # 2) saudação humana (1x por 15 min)
-    if is_greeting(body) and should_greet(from_number):
-        resp = human_greeting(body)
+    if it.greeting and should_greet(from_number):
+        resp = human_greeting(body, it)
         mark_greeted(from_number)
+        counters.incr("greetings")
         save_lead(from_number, body, resp)
-        return _send_and_http_respond(from_number, resp)
+        return resp
 
     # 3) catálogo (link curto / cards enxutos)
-    resp_cat = tentar_responder_com_catalogo(body, current_app.config["OFFERS_PATH"])
+    resp_cat = tentar_responder_com_catalogo(
+        body, current_app.config["OFFERS_PATH"], current_app.config.get("CATALOG_MIN_SCORE", 1.2),
+        intencao=it.catalog, veicular=it.vehicle,
+    )
     if resp_cat:
+        counters.incr("catalog_hits")
         save_lead(from_number, body, resp_cat)
-        return _send_and_http_respond(from_number, resp_cat)
+        return resp_cat
 
     # 4) IA fallback
     resp_ai = gerar_resposta(from_number, body)
     save_lead(from_number, body, resp_ai)
-    return _send_and_http_respond(from_number, resp_ai)
+    return resp_ai
+
+def _coalesce(from_number: str, bodies: list) -> list:
+    """Mensagens picadas ("oi" / "queria saber" / "do pulse") viram um turno só, exceto
+    no meio do agendamento (cada mensagem responde uma pergunta). Um pedido de agendamento
+    ou SAIR no lote também corta: o que vem antes vira um turno, ele e o resto vão um a um
+    ("quero agendar" / "test drive": o segundo já responde a 1ª pergunta do fluxo)."""
+    if session_store.get_appointment(from_number):
+        return bodies
+    for n, b in enumerate(bodies):
+        if b.upper() == "SAIR" or classify(b).appointment:
+            return (["\n".join(bodies[:n])] if n else []) + bodies[n:]
+    return ["\n".join(bodies)]
 
 @bp.route("/whatsapp", methods=["POST"])
 def whatsapp(): return _handle_incoming()
@@ -477,33 +746,68 @@ def webhook():  return _handle_incoming()
 
 @bp.route("/simulate")
 def simulate():
-    frm = request.args.get("from", "whatsapp:+5500000000000")
-    msg = request.args.get("msg", "Bom dia")
-    with current_app.test_request_context("/webhook", method="POST", data={"From": frm, "Body": msg}):
-        return _handle_incoming()
+    # sempre síncrono (TwiML na resposta): não passa pela assinatura nem pela fila do Twilio
+    frm = normalize_phone(request.args.get("from", "whatsapp:+5500000000000"))
+    msg = (request.args.get("msg", "Bom dia") or "").strip()
+    return Response(twiml(_process_message(frm, msg)), mimetype="application/xml")
 
-@bp.route("/painel")
-def painel():
-    path = current_app.config["LEADS_FILE"]
-    if not os.path.exists(path): return "Nenhum lead ainda."
-    rows = []
-    with open(path, "r", encoding="utf-8") as f:
-        for r in csv.reader(f): rows.append(r)
-    header, itens = rows[0], rows[1:][::-1]
-    html = """
-    <html><head><meta charset="utf-8"><title>Leads</title>
-    <style>
+_PANEL_CSS = """
     body{font-family:system-ui,Segoe UI,Roboto,Arial,sans-serif;padding:20px}
     table{border-collapse:collapse;width:100%}
     th,td{border:1px solid #ddd;padding:8px;text-align:left}
     th{background:#f5f5f5} tr:nth-child(even) td{background:#fafafa}
-    </style></head><body>
-    <h2>Leads Registrados</h2>
-    <table><thead><tr>{% for c in header %}<th>{{c}}</th>{% endfor %}</tr></thead>
-    <tbody>{% for r in itens %}<tr>{% for c in r %}<td>{{c}}</td>{% endfor %}</tr>{% endfor %}</tbody>
-    </table></body></html>
+    nav{margin:12px 0} nav a{margin-right:12px}
+"""
+
+def _csv_panel(titulo: str, h2: str, fetch):
     """
-    return render_template_string(html, header=header, itens=itens)
+    Página ?page=N (0 = mais recentes) com ?per_page= e ?phone=; HTML gerado em streaming.
+    fetch(page, per_page, phone) -> (header, linhas, total).
+    """
+    try:
+        page = max(0, int(request.args.get("page", 0)))
+        per_page = min(500, max(1, int(request.args.get("per_page", 50))))
+    except ValueError:
+        return "Parâmetros inválidos", 400
+    phone = normalize_phone(request.args.get("phone")) or None
+    header, rows, total = fetch(page, per_page, phone)
+    args = {k: v for k, v in request.args.items() if k != "page"}
+    pages = max(1, -(-total // per_page))
+
+    def link(p, label):
+        return f'<a href="?{html_escape(urlencode(dict(args, page=p)))}">{label}</a>'
+
+    def gen():
+        yield (f'<html><head><meta charset="utf-8"><title>{titulo}</title><style>{_PANEL_CSS}</style></head><body>'
+               f"<h2>{h2}</h2>")
+        nav = [f"{total} registro(s){' de ' + html_escape(phone) if phone else ''} · página {page + 1} de {pages}"]
+        if page > 0: nav.append(link(page - 1, "« mais recentes"))
+        if page + 1 < pages: nav.append(link(page + 1, "mais antigos »"))
+        yield "<nav>" + " ".join(nav) + "</nav>"
+        yield "<table><thead><tr>" + "".join(f"<th>{html_escape(c)}</th>" for c in header) + "</tr></thead><tbody>"
+        for r in rows:
+            yield "<tr>" + "".join(f"<td>{html_escape(c)}</td>" for c in r) + "</tr>"
+        yield "</tbody></table></body></html>"
+
+    return Response(gen(), mimetype="text/html")
+
+@bp.route("/painel")
+def painel():
+    path = current_app.config["LEADS_FILE"]
+    if not os.path.exists(path) and not lead_log.archived(): return "Nenhum lead ainda."
+
+    def fetch(page, per_page, phone):
+        if phone:  # por telefone: índice do SQLite (não precisa abrir segmento nenhum)
+            return (list(LEAD_COLUMNS), lead_store.query(phone=phone, limit=per_page, offset=page * per_page,
+                                                         as_dict=False), lead_store.count(phone))
+        idx = get_csv_index(path)
+        rows, quentes = idx.page(page, per_page)
+        total = quentes + lead_log.archived_rows()
+        if len(rows) < per_page and total > quentes:  # página continua nos segmentos arquivados
+            rows += lead_log.page_archived(max(0, page * per_page - quentes), per_page - len(rows))
+        return idx.header or list(LEAD_COLUMNS), rows, total
+
+    return _csv_panel("Leads", "Leads Registrados", fetch)
 
 @bp.route("/agenda")
 def agenda():
@@ -511,32 +815,24 @@ def agenda():
     if token != current_app.config["ADMIN_TOKEN"]: return "Acesso negado", 403
     path = current_app.config["APPT_FILE"]
     if not os.path.exists(path): return "Nenhum agendamento ainda."
-    rows = []
-    with open(path, "r", encoding="utf-8") as f:
-        for r in csv.reader(f): rows.append(r)
-    header, itens = rows[0], rows[1:][::-1]
-    html = """
-    <html><head><meta charset="utf-8"><title>Agenda</title>
-    <style>
-    body{font-family:system-ui,Segoe UI,Roboto,Arial,sans-serif;padding:20px}
-    table{border-collapse:collapse;width:100%}
-    th,td{border:1px solid #ddd;padding:8px;text-align:left}
-    th{background:#f5f5f5} tr:nth-child(even) td{background:#fafafa}
-    </style></head><body>
-    <h2>Agendamentos</h2>
-    <table><thead><tr>{% for c in header %}<th>{{c}}</th>{% endfor %}</tr></thead>
-    <tbody>{% for r in itens %}<tr>{% for c in r %}<td>{{c}}</td>{% endfor %}</tr>{% endfor %}</tbody>
-    </table></body></html>
-    """
-    return render_template_string(html, header=header, itens=itens)
+    idx = get_csv_index(path)
+
+    def fetch(page, per_page, phone):
+        rows, total = idx.page(page, per_page, phone)
+        return idx.header, rows, total
+
+    return _csv_panel("Agenda", "Agendamentos", fetch)
 
 @bp.route("/reset", methods=["POST"])
 def reset():
     token = request.args.get("token")
     if token != current_app.config["ADMIN_TOKEN"]: return "Acesso negado", 403
     deleted=[]
+    log_writer.flush()  # o que já estava na fila vai antes do reset; o writer reabre os arquivos apagados
     with _lock:
         for p in [current_app.config["LEADS_FILE"], current_app.config["SESSIONS_FILE"], current_app.config["APPT_FILE"]]:
             if os.path.exists(p): os.remove(p); deleted.append(os.path.basename(p))
-        sessions.clear(); save_sessions(sessions)
+        lead_log.clear()
+        sessions.clear(); session_store.clear(); lead_store.clear()
+        counters.reset("leads", "sessions", "appointments")
     return jsonify({"ok": True, "deleted": deleted})
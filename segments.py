@@ -0,0 +1,186 @@
+# segments.py
+import os, csv, glob, gzip, json, time, fcntl, shutil, logging, threading
+from collections import Counter
+from datetime import datetime
+from typing import Optional
+
+log = logging.getLogger("fiat-whatsapp")
+
+
+class SegmentedLog:
+    """
+    Log CSV em segmentos: o arquivo quente (ex.: data/leads.csv) recebe as linhas novas e,
+    ao passar de `max_bytes` ou quando a 1ª linha fica mais velha que `max_age_s`, vira um
+    segmento compactado em `archive_dir` (leads-<primeiro ts>-<id>.csv.gz).
+    O manifest.json lista cada segmento com first_ts/last_ts, nº de linhas e linhas por hora,
+    então leitores por período abrem só os segmentos que cruzam o intervalo e os totais
+    saem do manifest sem descompactar nada.
+    A 1ª coluna do CSV é o timestamp ISO (ordem de string = ordem de tempo).
+    """
+    def __init__(self, hot_path: str, archive_dir: str, max_bytes: int, max_age_s: float):
+        self.hot_path = hot_path
+        self.archive_dir = archive_dir
+        self.max_bytes = max_bytes
+        self.max_age_s = max_age_s
+        self.manifest_path = os.path.join(archive_dir, "manifest.json")
+        self._prefix = os.path.splitext(os.path.basename(hot_path))[0]
+        self._lock = threading.Lock()
+        self._manifest, self._manifest_mtime = {"segments": []}, None
+        self._first, self._last_size = None, 0  # ts da 1ª linha do arquivo quente (cache do maybe_rotate)
+        os.makedirs(archive_dir, exist_ok=True)
+        self._recover()
+
+    def _recover(self):
+        """Compacta cópias deixadas por uma rotação interrompida (processo dono já morreu)."""
+        for pending in glob.glob(os.path.join(self.archive_dir, ".pending-*.csv")):
+            try:
+                os.kill(int(os.path.basename(pending).split("-")[1]), 0)
+                continue  # dono vivo: ainda está compactando
+            except (ProcessLookupError, ValueError, IndexError):
+                pass
+            except PermissionError:
+                continue
+            meu = os.path.join(self.archive_dir, f".pending-{os.getpid()}-{time.time_ns()}.csv")
+            try: os.rename(pending, meu)  # outro worker pode ter pego primeiro
+            except FileNotFoundError: continue
+            self._archive(meu)
+
+    # ---- rotação (chamada pelo CsvLogWriter com o flock do arquivo quente) ----
+    def maybe_rotate(self, f):
+        """Se o arquivo quente passou do limite: copia, trunca e devolve o passo lento (compactar)."""
+        size = os.fstat(f.fileno()).st_size
+        encolheu, self._last_size = size < self._last_size, size
+        if size == 0:
+            self._first = None
+            return None
+        if size < self.max_bytes:
+            # o ts da 1ª linha fica em cache; só relê o arquivo se ele encolheu (rotação de outro
+            # worker) ou se o cache diz que venceu: outro worker pode ter rotacionado e o arquivo
+            # crescido de novo, e aí o cache é mais velho que a 1ª linha real (nunca mais novo)
+            if self._first is None or encolheu: self._first = self._first_ts()
+            if self._idade(self._first) < self.max_age_s: return None
+            self._first = self._first_ts()
+            if self._idade(self._first) < self.max_age_s: return None
+        self._first, self._last_size = None, 0
+        pending = os.path.join(self.archive_dir, f".pending-{os.getpid()}-{time.time_ns()}.csv")
+        with open(self.hot_path, "rb") as src, open(pending, "wb") as dst:
+            shutil.copyfileobj(src, dst)
+        f.truncate(0)  # mesmo inode: os outros workers seguem escrevendo no arquivo certo
+        return lambda: self._archive(pending)
+
+    @staticmethod
+    def _idade(first: Optional[str]) -> float:
+        try: return (datetime.now() - datetime.fromisoformat(first)).total_seconds() if first else 0
+        except ValueError: return 0
+
+    def _first_ts(self) -> Optional[str]:
+        with open(self.hot_path, "r", newline="", encoding="utf-8") as f:
+            rdr = csv.reader(f)
+            next(rdr, None)  # cabeçalho
+            row = next(rdr, None)
+        return row[0] if row else None
+
+    def _archive(self, pending: str):
+        rows, hours, first, last = 0, Counter(), None, None
+        with open(pending, "r", newline="", encoding="utf-8") as f:
+            rdr = csv.reader(f)
+            next(rdr, None)
+            for r in rdr:
+                if not r: continue
+                rows += 1; hours[r[0][:13]] += 1
+                first = first or r[0]; last = r[0]
+        if not rows:
+            os.remove(pending); return
+        nome = f"{self._prefix}-{first[:19].replace(':', '').replace('-', '')}-{time.time_ns() % 10**9:09d}.csv.gz"
+        final = os.path.join(self.archive_dir, nome)
+        with open(pending, "rb") as src, gzip.open(final + ".tmp", "wb") as dst:
+            shutil.copyfileobj(src, dst)
+        os.replace(final + ".tmp", final)
+        seg = {"file": nome, "first_ts": first, "last_ts": last, "rows": rows,
+               "bytes": os.path.getsize(final), "hours": dict(hours)}
+        with open(self.manifest_path + ".lock", "a") as lk:  # vários workers podem rotacionar
+            fcntl.flock(lk, fcntl.LOCK_EX)
+            m = self._read_manifest()
+            m["segments"] = sorted(m["segments"] + [seg], key=lambda s: s["first_ts"])
+            tmp = self.manifest_path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as out:
+                json.dump(m, out, ensure_ascii=False)
+            os.replace(tmp, self.manifest_path)
+        os.remove(pending)
+        log.info(f"Segmento arquivado: {nome} ({rows} linhas, {seg['bytes']} bytes)")
+
+    # ---- leitura ----
+    def _read_manifest(self) -> dict:
+        try:
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {"segments": []}
+
+    def archived(self) -> list:
+        """Segmentos do manifest (relido só quando o arquivo muda), do mais antigo ao mais novo."""
+        try: mtime = os.stat(self.manifest_path).st_mtime_ns
+        except FileNotFoundError: mtime = None
+        with self._lock:
+            if mtime != self._manifest_mtime:
+                self._manifest = self._read_manifest() if mtime else {"segments": []}
+                self._manifest_mtime = mtime
+            return self._manifest["segments"]
+
+    def segments(self, since: Optional[str] = None, until: Optional[str] = None) -> list:
+        """Segmentos arquivados que cruzam [since, until)."""
+        return [s for s in self.archived()
+                if (not since or s["last_ts"] >= since) and (not until or s["first_ts"] < until)]
+
+    def read_segment(self, seg: dict):
+        with gzip.open(os.path.join(self.archive_dir, seg["file"]), "rt", newline="", encoding="utf-8") as f:
+            rdr = csv.reader(f)
+            next(rdr, None)
+            yield from (r for r in rdr if r)
+
+    def iter_rows(self, since: Optional[str] = None, until: Optional[str] = None, phone: Optional[str] = None,
+                  phone_col: int = 1):
+        """Linhas em ordem cronológica, abrindo só os segmentos do período (e o arquivo quente)."""
+        def ok(r):
+            return ((not since or r[0] >= since) and (not until or r[0] < until)
+                    and (not phone or (len(r) > phone_col and r[phone_col] == phone)))
+        for seg in self.segments(since, until):
+            yield from filter(ok, self.read_segment(seg))
+        yield from filter(ok, self.read_hot())
+
+    def read_hot(self):
+        """Linhas do arquivo quente (ainda não arquivadas)."""
+        if not os.path.exists(self.hot_path): return
+        with open(self.hot_path, "r", newline="", encoding="utf-8") as f:
+            rdr = csv.reader(f)
+            next(rdr, None)
+            yield from (r for r in rdr if r)
+
+    def page_archived(self, skip: int, n: int) -> list:
+        """Linhas arquivadas do mais novo para o mais velho, pulando `skip`; só abre os segmentos da página."""
+        out = []
+        for seg in reversed(self.archived()):
+            if len(out) >= n: break
+            if skip >= seg["rows"]:
+                skip -= seg["rows"]; continue
+            linhas = list(self.read_segment(seg))[::-1]  # segmento tem tamanho limitado (max_bytes)
+            out += linhas[skip:skip + n - len(out)]
+            skip = 0
+        return out
+
+    def archived_rows(self) -> int:
+        return sum(s["rows"] for s in self.archived())
+
+    def archived_hours(self, since: str) -> Counter:
+        c = Counter()
+        for s in self.segments(since=since):
+            c.update({h: n for h, n in s["hours"].items() if h >= since[:13]})
+        return c
+
+    def clear(self):
+        """Apaga segmentos e manifest (o arquivo quente é do chamador)."""
+        with open(self.manifest_path + ".lock", "a") as lk:
+            fcntl.flock(lk, fcntl.LOCK_EX)
+            for p in glob.glob(os.path.join(self.archive_dir, f"{self._prefix}-*.csv.gz")):
+                os.remove(p)
+            if os.path.exists(self.manifest_path): os.remove(self.manifest_path)
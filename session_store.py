@@ -0,0 +1,153 @@
+# session_store.py
+import os, json, sqlite3, threading, logging, time
+
+log = logging.getLogger("fiat-whatsapp")
+
+
+class SessionStore:
+    """
+    Estado por telefone em SQLite (modo WAL), compartilhado entre workers do gunicorn:
+    - sessions: histórico da conversa (uma linha por telefone, com `rev` para invalidar caches)
+      e o resumo corrido das mensagens que já saíram do histórico;
+    - appointments: passo atual do agendamento (FSM);
+    - greetings: quando o telefone foi saudado pela última vez.
+    Cada escrita é uma transação curta; os processos se coordenam pelo lock do próprio SQLite.
+    Uma conexão por thread (sqlite3 não compartilha conexão entre threads).
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            " phone TEXT PRIMARY KEY, history TEXT NOT NULL, updated_at REAL NOT NULL, rev INTEGER NOT NULL DEFAULT 0)"
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS appointments ("
+            " phone TEXT PRIMARY KEY, state TEXT NOT NULL, updated_at REAL NOT NULL)"
+        )
+        conn.execute("CREATE TABLE IF NOT EXISTS greetings (phone TEXT PRIMARY KEY, greeted_at REAL NOT NULL)")
+        # migrações sob BEGIN IMMEDIATE: os workers sobem juntos e só o primeiro altera a tabela
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            cols = {r[1] for r in conn.execute("PRAGMA table_info(sessions)")}  # bancos criados antes das colunas
+            if "rev" not in cols: conn.execute("ALTER TABLE sessions ADD COLUMN rev INTEGER NOT NULL DEFAULT 0")
+            if "summary" not in cols: conn.execute("ALTER TABLE sessions ADD COLUMN summary TEXT")
+            # nº de sessões mantido por trigger na mesma transação do INSERT/DELETE (o upsert que só
+            # atualiza não conta): total de todos os workers numa leitura por chave
+            conn.execute("CREATE TABLE IF NOT EXISTS totals (name TEXT PRIMARY KEY, n INTEGER NOT NULL)")
+            conn.execute("INSERT OR IGNORE INTO totals (name, n) SELECT 'sessions', COUNT(*) FROM sessions")
+            conn.execute("CREATE TRIGGER IF NOT EXISTS sessions_total_ins AFTER INSERT ON sessions"
+                         " BEGIN UPDATE totals SET n = n + 1 WHERE name = 'sessions'; END")
+            conn.execute("CREATE TRIGGER IF NOT EXISTS sessions_total_del AFTER DELETE ON sessions"
+                         " BEGIN UPDATE totals SET n = n - 1 WHERE name = 'sessions'; END")
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)  # autocommit
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    # ---- sessions ----
+    def get_versioned(self, phone: str):
+        """(rev, histórico) ou None."""
+        row = self._conn().execute("SELECT rev, history FROM sessions WHERE phone = ?", (phone,)).fetchone()
+        return (row[0], json.loads(row[1])) if row else None
+
+    def rev(self, phone: str):
+        row = self._conn().execute("SELECT rev FROM sessions WHERE phone = ?", (phone,)).fetchone()
+        return row[0] if row else None
+
+    def put(self, phone: str, history: list) -> int:
+        """Grava o histórico e devolve a nova `rev`."""
+        return self._conn().execute(
+            "INSERT INTO sessions (phone, history, updated_at, rev) VALUES (?, ?, ?, 1)"
+            " ON CONFLICT(phone) DO UPDATE SET history = excluded.history, updated_at = excluded.updated_at,"
+            " rev = sessions.rev + 1 RETURNING rev",
+            (phone, json.dumps(history, ensure_ascii=False), time.time()),
+        ).fetchone()[0]
+
+    def get_summary(self, phone: str):
+        row = self._conn().execute("SELECT summary FROM sessions WHERE phone = ?", (phone,)).fetchone()
+        return row[0] if row else None
+
+    def put_summary(self, phone: str, summary: str):
+        # só atualiza conversa que ainda existe (SAIR no meio do resumo apaga tudo)
+        self._conn().execute("UPDATE sessions SET summary = ? WHERE phone = ?", (summary, phone))
+
+    def delete(self, phone: str) -> bool:
+        return self._conn().execute("DELETE FROM sessions WHERE phone = ?", (phone,)).rowcount > 0
+
+    def clear(self):
+        self._conn().execute("DELETE FROM sessions")
+
+    def count(self) -> int:
+        return self._conn().execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+    def total(self) -> int:
+        """Mesmo que count(), sem varrer a tabela (linha mantida pelos triggers)."""
+        return self._conn().execute("SELECT n FROM totals WHERE name = 'sessions'").fetchone()[0]
+
+    # ---- appointments (FSM) ----
+    def get_appointment(self, phone: str):
+        row = self._conn().execute("SELECT state FROM appointments WHERE phone = ?", (phone,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put_appointment(self, phone: str, state: dict):
+        self._conn().execute(
+            "INSERT INTO appointments (phone, state, updated_at) VALUES (?, ?, ?)"
+            " ON CONFLICT(phone) DO UPDATE SET state = excluded.state, updated_at = excluded.updated_at",
+            (phone, json.dumps(state, ensure_ascii=False), time.time()),
+        )
+
+    def delete_appointment(self, phone: str):
+        self._conn().execute("DELETE FROM appointments WHERE phone = ?", (phone,))
+
+    # ---- greetings ----
+    def greeted_at(self, phone: str):
+        row = self._conn().execute("SELECT greeted_at FROM greetings WHERE phone = ?", (phone,)).fetchone()
+        return row[0] if row else None
+
+    def mark_greeted(self, phone: str, ts: float = None):
+        self._conn().execute(
+            "INSERT INTO greetings (phone, greeted_at) VALUES (?, ?)"
+            " ON CONFLICT(phone) DO UPDATE SET greeted_at = excluded.greeted_at",
+            (phone, time.time() if ts is None else ts),
+        )
+
+    def migrate_from_json(self, json_path: str) -> int:
+        """Importa o sessions.json antigo (uma vez) e o renomeia para .migrated."""
+        if not os.path.exists(json_path):
+            return 0
+        try:
+            with open(json_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except Exception as e:
+            log.error(f"Falha ao migrar {json_path}: {e}")
+            return 0
+        if not isinstance(data, dict):
+            log.error(f"Falha ao migrar {json_path}: esperado um objeto {{telefone: histórico}}")
+            return 0
+
+        now = time.time()
+        conn = self._conn()
+        conn.execute("BEGIN")
+        try:
+            conn.executemany(
+                "INSERT OR IGNORE INTO sessions (phone, history, updated_at) VALUES (?, ?, ?)",
+                [(phone, json.dumps(h, ensure_ascii=False), now) for phone, h in data.items() if isinstance(h, list)],
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        os.replace(json_path, json_path + ".migrated")
+        log.info(f"Sessões migradas de {json_path}: {len(data)} conversas")
+        return len(data)
@@ -0,0 +1,112 @@
+# ttl_cache.py
+import time, threading
+from collections import OrderedDict
+
+
+class TTLCache:
+    """
+    Cache LRU com limite de entradas e TTL de ociosidade.
+    - `loader(key)` (opcional) busca o valor quando não está em memória (None = não existe);
+    - `sizeof(value)` (opcional) estima bytes por entrada, para acompanhar o uso de RAM;
+    - `fresh(key, value)` (opcional) confere um hit contra a fonte (ex.: outro worker gravou
+      uma versão mais nova); se devolver False a entrada é descartada e recarregada.
+    Tudo sob um lock só; as operações são O(1).
+    """
+    def __init__(self, max_entries: int, ttl: float, loader=None, sizeof=None, fresh=None):
+        self.max_entries = max(1, int(max_entries))
+        self.ttl = ttl
+        self._loader = loader
+        self._sizeof = sizeof or (lambda v: 0)
+        self._fresh = fresh
+        self._data = OrderedDict()  # key -> (value, last_access, bytes)
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self._stats = {"hits": 0, "misses": 0, "loads": 0, "evictions": 0, "expirations": 0, "stale": 0}
+
+    def get(self, key, default=None):
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and now - item[1] <= self.ttl:
+                self._data[key] = (item[0], now, item[2])
+                self._data.move_to_end(key)
+                hit = item[0]
+                if self._fresh is None:
+                    self._stats["hits"] += 1
+                    return hit
+            else:
+                hit = None
+                if item is not None:
+                    self._drop(key, "expirations")
+                self._stats["misses"] += 1
+        if hit is not None:
+            if self._fresh(key, hit):  # fora do lock: pode ir ao disco
+                with self._lock: self._stats["hits"] += 1
+                return hit
+            with self._lock:
+                self._stats["stale"] += 1; self._stats["misses"] += 1
+                if self._data.get(key, (None,))[0] is hit: self._drop(key)
+        if self._loader is None:
+            return default
+        value = self._loader(key)  # fora do lock: pode ir ao disco
+        if value is None:
+            return default
+        with self._lock:
+            self._stats["loads"] += 1
+            if key not in self._data:  # outro thread pode ter gravado algo mais novo
+                self._put(key, value, now)
+            return self._data[key][0]
+
+    def __setitem__(self, key, value):
+        with self._lock:
+            self._put(key, value, time.monotonic())
+
+    def pop(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None: return default
+            self._drop(key)
+            return item[0]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def __contains__(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            return item is not None and time.monotonic() - item[1] <= self.ttl
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self) -> dict:
+        with self._lock:
+            self._expire(time.monotonic())
+            total = self._stats["hits"] + self._stats["misses"]
+            return dict(self._stats, entries=len(self._data), max_entries=self.max_entries, ttl_s=self.ttl,
+                        approx_bytes=self._bytes, hit_rate=round(self._stats["hits"] / total, 4) if total else None)
+
+    # ---- internos (com o lock já pego) ----
+    def _put(self, key, value, now):
+        if key in self._data:
+            self._drop(key)
+        size = self._sizeof(value)
+        self._data[key] = (value, now, size)
+        self._bytes += size
+        self._expire(now)
+        while len(self._data) > self.max_entries:
+            self._drop(next(iter(self._data)), "evictions")
+
+    def _expire(self, now):
+        # ordem LRU = ordem de último acesso: os ociosos estão no começo
+        while self._data:
+            key, item = next(iter(self._data.items()))
+            if now - item[1] <= self.ttl: break
+            self._drop(key, "expirations")
+
+    def _drop(self, key, motivo=None):
+        _, _, size = self._data.pop(key)
+        self._bytes -= size
+        if motivo: self._stats[motivo] += 1
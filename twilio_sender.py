@@ -0,0 +1,74 @@
+# twilio_sender.py
+import time, random, logging, threading
+from collections import deque
+
+from requests.exceptions import ConnectTimeout
+from twilio.base.exceptions import TwilioRestException
+from twilio.http.http_client import TwilioHttpClient
+from twilio.rest import Client as TwilioClient
+
+log = logging.getLogger("fiat-whatsapp")
+
+
+class TwilioSender:
+    """
+    Envio de WhatsApp pela API do Twilio, um por processo:
+    - um Client só, sobre uma sessão HTTP com pool (keep-alive): sem handshake TLS por mensagem;
+    - o POST não é idempotente: só repete quando a mensagem com certeza NÃO saiu.
+      429 e ConnectTimeout (conexão nem abriu) repetem até `retries` vezes com backoff
+      exponencial com jitter; 5xx repete no máximo 1 vez (o Twilio pode ter aceitado);
+      conexão caída no meio, timeout de leitura e outro 4xx falham na hora (sem duplicar);
+    - latência de cada envio (com as repetições) nas últimas `window` mensagens.
+    """
+    def __init__(self, sid: str, token: str, from_: str, retries: int = 3, backoff: float = 0.5,
+                 timeout: float = 10, window: int = 500):
+        self.from_ = from_
+        self.credentials = (sid, token, from_)
+        self.retries, self.backoff = max(0, retries), backoff
+        self._client = TwilioClient(sid, token, http_client=TwilioHttpClient(pool_connections=True, timeout=timeout))
+        self._lock = threading.Lock()
+        self._lat = deque(maxlen=window)
+        self._stats = {"sent": 0, "failed": 0, "retries": 0, "last_error": None}
+
+    def send(self, to_phone: str, body: str) -> bool:
+        to_fmt = to_phone if str(to_phone).startswith("whatsapp:") else f"whatsapp:{to_phone}"
+        t0 = time.perf_counter()
+        tentativa, repetiu_5xx = 0, False
+        while True:
+            try:
+                msg = self._client.messages.create(from_=self.from_, to=to_fmt, body=body)
+                ok, erro = True, None
+                break
+            except TwilioRestException as e:
+                erro = f"{e.status} {e.code or ''}".strip()
+                pode = e.status == 429 or (e.status >= 500 and not repetiu_5xx)
+                repetiu_5xx = repetiu_5xx or e.status >= 500
+            except ConnectTimeout as e:
+                erro, pode = type(e).__name__, True
+            except Exception as e:
+                # inclui ConnectionError/ReadTimeout: o pedido pode ter chegado ao Twilio
+                erro, pode = type(e).__name__, False
+            if not pode or tentativa >= self.retries:
+                ok = False
+                break
+            tentativa += 1
+            with self._lock: self._stats["retries"] += 1
+            time.sleep(random.uniform(0, self.backoff * 2 ** (tentativa - 1)) + self.backoff / 2)
+        ms = (time.perf_counter() - t0) * 1000
+        with self._lock:
+            self._lat.append(ms)
+            self._stats["sent" if ok else "failed"] += 1
+            if erro: self._stats["last_error"] = erro
+        if ok:
+            log.info(f"Twilio API enviado: sid={msg.sid} ({ms:.0f} ms, {tentativa} repetições)")
+        else:
+            log.error(f"Falha ao enviar WhatsApp via Twilio API para {to_phone}: {erro} ({tentativa} repetições)")
+        return ok
+
+    def stats(self) -> dict:
+        with self._lock:
+            lat = sorted(self._lat)
+            st = dict(self._stats)
+        pct = lambda q: round(lat[min(len(lat) - 1, int(len(lat) * q))], 1) if lat else None
+        st.update(p50_ms=pct(0.50), p95_ms=pct(0.95), max_ms=round(lat[-1], 1) if lat else None)
+        return st